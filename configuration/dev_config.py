@@ -7,6 +7,9 @@ import os
 # GitHub repository
 GITHUB_OWNER = "swisstopo"
 GITHUB_REPO = "topo-satromo"
+# Processor version cache, used when neither GITHUB_SHA / SATROMO_RELEASE_VERSION nor the local git checkout provide it
+PROCESSOR_VERSION_CACHE = os.path.join("cache", "processor_version.json")
+PROCESSOR_VERSION_CACHE_TTL = 86400  # Seconds
 
 # Secrets
 GDRIVE_SECRETS = os.path.join("secrets", "geetest-credentials.secret")
@@ -14,6 +17,10 @@ RCLONE_SECRETS = os.path.join("secrets", "rclone.conf")
 FSDI_SECRETS = os.path.join("secrets", "stac_fsdi.json")
 
 # File and directory paths
+# State store of running/completed tasks, product updates and empty step0 assets
+STATE_DB = os.path.join("tools", "satromo_state.sqlite")
+# Deprecated: legacy CSV files, only read once to create the state store and no longer updated. They will be
+# removed once the state store is committed.
 GEE_RUNNING_TASKS = os.path.join("processing", "running_tasks.csv")
 GEE_COMPLETED_TASKS = os.path.join("tools", "completed_tasks.csv")
 EMPTY_ASSET_LIST = os.path.join("tools", "step0_empty_assets.csv")
@@ -36,6 +43,37 @@ S3_DESTINATION_INT = os.path.join("s3INT:satromoint", "data")
 # TODO: check if needed
 SHARD_SIZE = 256
 
+# Export submission: number of exports started in parallel, attempts per export and
+# initial backoff in seconds between attempts (doubled after every failed attempt)
+EXPORT_MAX_WORKERS = 4
+EXPORT_MAX_ATTEMPTS = 5
+EXPORT_RETRY_BACKOFF = 2
+# Maximum estimated size in bytes of one export task, larger exports are split into a grid of tiles
+EXPORT_MAX_BYTES_PER_TASK = 2 * 1024 ** 3
+
+# Number of products processed in parallel
+PRODUCT_MAX_WORKERS = 4
+
+# Step0 backfill: maximum number of dates whose export tasks run at the same time (missing dates beyond are
+# generated by the next runs, most recent first) and number of dates whose generation is started in parallel
+STEP0_MAX_RUNNING_DATES = 10
+STEP0_MAX_WORKERS = 4
+
+# Number of merged files waiting to be published, each one takes disk space on the runner:
+# at most PUBLISH_QUEUE_SIZE + 1 merged files are on disk, the waiting ones and the one being published
+PUBLISH_QUEUE_SIZE = 1
+
+# Merge of the exported tiles: size in pixels of the windows merged at once, block size of the COG
+# and number of threads used to compress it
+MERGE_WINDOW_SIZE = 2048
+MERGE_BLOCK_SIZE = 512
+MERGE_NUM_THREADS = "ALL_CPUS"
+# Cache of the cutline BUFFER rasterized on the grids of the merge windows and thumbnails:
+# number of masks kept in memory and on disk
+CUTLINE_MASK_CACHE_DIR = os.path.join("cache", "cutline_masks")
+CUTLINE_MASK_MEMORY_SIZE = 16
+CUTLINE_MASK_CACHE_SIZE = 1024
+
 # Development environment parameters
 RESULTS = os.path.join("results")  # Local path for results
 
@@ -140,16 +178,19 @@ PRODUCT_NDVI_MAX_TOA = {
 # Configure the dict containing
 # -  the name of the custom collection (asset) in GEE, (eg: projects/satromo-int/assets/COL_S2_SR_HARMONIZED_SWISS )
 # -  the function to process the raw data for teh collection (eg:step0_processor_s2_sr.generate_s2_sr_mosaic_for_single_date )
+# -  the resolutions exported by the function for each date, a date is complete if all are present (eg: ['10m', '20m'])
 
 # Make sure that the products above use the corresponding custom collection (assets)
 
 step0 = {
     # 'projects/satromo-exolabs/assets/col_s2_toa': {
     #    'step0_function': 'step0_processor_s2_toa.generate_s2_toa_mosaic_for_single_date',
+    #    'asset_resolutions': ['10m'],  # resolutions exported for each date, all are required
     #    # cleaning_older_than: 2 # entry used to clean assets
     # },
     'projects/satromo-int/assets/COL_S2_SR_HARMONIZED_SWISS': {
-        'step0_function': 'step0_processor_s2_sr.generate_s2_sr_mosaic_for_single_date'
+        'step0_function': 'step0_processor_s2_sr.generate_s2_sr_mosaic_for_single_date',
+        'asset_resolutions': ['10m', '20m'],  # resolutions exported for each date, all are required
         # cleaning_older_than: 2 # entry used to clean assets
     }
 }
@@ -1,55 +1,314 @@
 import os
+import json
 import configuration as config
-import subprocess
 import rasterio
 import numpy as np
-import rasterio
+import hashlib
+from collections import OrderedDict
+import fiona
+from fiona.transform import transform_geom
+from rasterio.features import geometry_mask, rasterize
+
+# Thumbnail palettes by product (name prefix): classes [lower_limit, first upper limit], (previous upper limit, upper limit]
+# with one RGB color per class, the last color is used above the last upper limit, values below lower_limit are black
+THUMBNAIL_PALETTES = {
+    "ch.swisstopo.swisseo_vhi": {
+        "lower_limit": 0,
+        "upper_limits": [10, 20, 30, 40, 50, 60, 100],
+        "colors": [
+            (181, 106, 41),    # [0,10] extremely dry - dark brown
+            (206, 133, 64),    # (10,20] severely dry - brown
+            (245, 205, 133),   # (20,30] moderately dry - beige
+            (255, 245, 186),   # (30,40] mild dry - yellow
+            (203, 255, 202),   # (40,50] normal - light green
+            (82, 189, 159),    # (50,60] good - green
+            (4, 112, 176),     # (60,100] excellent - blue
+            (128, 128, 128)    # Values over 100 - gray
+        ]
+    }
+}
+
+# Geometries of vector files by (file, CRS), see get_shapes()
+vector_shapes = {}
+# Bit-packed rasterized cutline masks by grid key, least recently used first, see get_cutline_mask()
+cutline_masks = OrderedDict()
+
+
+def get_shapes(vector_file, crs):
+    """
+    Reads the geometries of a vector file once per CRS, e.g. the cutline config.BUFFER.
+
+    Args:
+        vector_file (str): Path of the vector file.
+        crs (rasterio.crs.CRS): The CRS of the raster the geometries are used with.
+
+    Returns:
+        list: The geometries of the vector file in the given CRS.
+    """
+    crs_key = crs.to_string()
+    if (vector_file, crs_key) not in vector_shapes:
+        with fiona.open(vector_file) as vector:
+            shapes = [feature['geometry'] for feature in vector]
+            if vector.crs_wkt and rasterio.crs.CRS.from_wkt(vector.crs_wkt) != crs:
+                shapes = [transform_geom(vector.crs_wkt, crs_key, shape)
+                          for shape in shapes]
+        vector_shapes[(vector_file, crs_key)] = shapes
+    return vector_shapes[(vector_file, crs_key)]
+
+
+def get_cutline_mask_key(crs, transform, shape):
+    """
+    Returns the cache key of the rasterized cutline on a grid, which also changes when config.BUFFER is modified.
+
+    Args:
+        crs (rasterio.crs.CRS): The CRS of the grid.
+        transform (affine.Affine): The transform of the grid.
+        shape (tuple): The (height, width) of the grid.
+
+    Returns:
+        str: The cache key.
+    """
+    grid = [config.BUFFER, os.path.getmtime(config.BUFFER), crs.to_string(),
+            list(transform)[:6], list(shape)]
+    return hashlib.sha1(json.dumps(grid).encode("utf-8")).hexdigest()
+
+
+def evict_cutline_masks():
+    """
+    Removes the least recently used cutline masks from the disk cache, keeping config.CUTLINE_MASK_CACHE_SIZE masks.
+
+    Returns:
+        None
+    """
+    mask_files = sorted((os.path.join(config.CUTLINE_MASK_CACHE_DIR, filename)
+                         for filename in os.listdir(config.CUTLINE_MASK_CACHE_DIR) if filename.endswith(".npy")),
+                        key=os.path.getmtime)
+    for mask_file in mask_files[:max(0, len(mask_files) - config.CUTLINE_MASK_CACHE_SIZE)]:
+        os.remove(mask_file)
+
+
+def get_cutline_mask(crs, transform, shape):
+    """
+    Rasterizes the cutline config.BUFFER on a grid.
+    The masks are cached by grid, bit-packed, in memory (config.CUTLINE_MASK_MEMORY_SIZE masks) and on disk
+    (config.CUTLINE_MASK_CACHE_DIR), both evicting the least recently used masks. If the disk cache cannot be
+    written, e.g. on a read-only or full disk, the mask is only cached in memory.
+
+    Args:
+        crs (rasterio.crs.CRS): The CRS of the grid.
+        transform (affine.Affine): The transform of the grid.
+        shape (tuple): The (height, width) of the grid.
+
+    Returns:
+        numpy.ndarray: Boolean array of the given shape, True for the pixels whose center is inside the cutline.
+    """
+    key = get_cutline_mask_key(crs, transform, shape)
+    mask_file = os.path.join(config.CUTLINE_MASK_CACHE_DIR, key + ".npy")
+
+    packed_mask = cutline_masks.pop(key, None)
+    if packed_mask is None and os.path.exists(mask_file):
+        packed_mask = np.load(mask_file)
+        # Mark the mask as recently used
+        try:
+            os.utime(mask_file)
+        except OSError:
+            pass
+    if packed_mask is None:
+        mask = geometry_mask(get_shapes(config.BUFFER, crs), out_shape=shape,
+                             transform=transform, invert=True)
+        packed_mask = np.packbits(mask, axis=None)
+
+        # Write to a temporary file first, so that an interrupted write leaves no truncated mask
+        try:
+            os.makedirs(config.CUTLINE_MASK_CACHE_DIR, exist_ok=True)
+            with open(mask_file + ".tmp", "wb") as f:
+                np.save(f, packed_mask)
+            os.replace(mask_file + ".tmp", mask_file)
+            evict_cutline_masks()
+        except OSError as e:
+            # The disk cache is optional, the mask is kept in memory only
+            print(f"Cutline mask cache not written: {e}")
+
+    cutline_masks[key] = packed_mask
+    while len(cutline_masks) > config.CUTLINE_MASK_MEMORY_SIZE:
+        cutline_masks.popitem(last=False)
+
+    return np.unpackbits(packed_mask, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+
+
+def read_thumbnail_data(inputfile_name, indexes, thumbnail_width=256):
+    """
+    Reads bands of a raster decimated to the width of a thumbnail, using the overviews of the raster.
+
+    Args:
+        inputfile_name (str): Path of the raster.
+        indexes (list): The bands to read.
+        thumbnail_width (int): Width of the thumbnail in pixels, the height keeps the aspect ratio.
+
+    Returns:
+        tuple: The bands as masked array (nodata masked), the CRS and the transform of the thumbnail.
+    """
+    with rasterio.open(inputfile_name) as src:
+        thumbnail_height = max(
+            1, int(round(thumbnail_width * src.height / src.width)))
+        data = src.read(indexes, out_shape=(
+            len(indexes), thumbnail_height, thumbnail_width), masked=True)
+        transform = src.transform * src.transform.scale(
+            src.width / thumbnail_width, src.height / thumbnail_height)
+        return data, src.crs, transform
+
+
+def get_overlay_sprite(crs, transform, shape):
+    """
+    Returns the overlay of rivers (config.OVERVIEW_RIVERS) and lakes (config.OVERVIEW_LAKES) on a grid as RGBA sprite.
+
+    Args:
+        crs (rasterio.crs.CRS): The CRS of the grid.
+        transform (affine.Affine): The transform of the grid.
+        shape (tuple): The (height, width) of the grid.
+
+    Returns:
+        numpy.ndarray: The sprite as (4, height, width) uint8 array, white and opaque on rivers and lakes.
+    """
+    sprite = np.zeros((4,) + tuple(shape), dtype=np.uint8)
+    for vector_file in [config.OVERVIEW_RIVERS, config.OVERVIEW_LAKES]:
+        rasterize(get_shapes(vector_file, crs), out=sprite[3],
+                  transform=transform, default_value=255)
+    sprite[:3] = 255
+    return sprite
+
+
+def apply_overlay(rgb, crs, transform):
+    """
+    Alpha-composites the overlay of rivers and lakes onto a thumbnail.
+
+    Args:
+        rgb (numpy.ndarray): The thumbnail as (3, height, width) uint8 array, modified in place.
+        crs (rasterio.crs.CRS): The CRS of the thumbnail.
+        transform (affine.Affine): The transform of the thumbnail.
+
+    Returns:
+        numpy.ndarray: The thumbnail.
+    """
+    sprite = get_overlay_sprite(crs, transform, rgb.shape[1:])
+    alpha = sprite[3].astype(np.uint16)
+    rgb[:] = (rgb * (255 - alpha) + sprite[:3] * alpha + 127) // 255
+    return rgb
+
+
+def write_thumbnail_jpeg(rgb, thumbnail_name):
+    """
+    Encodes a thumbnail as JPEG.
+
+    Args:
+        rgb (numpy.ndarray): The thumbnail as (3, height, width) uint8 array.
+        thumbnail_name (str): Path of the JPEG.
+
+    Returns:
+        str: Path of the JPEG.
+    """
+    with rasterio.Env(GDAL_PAM_ENABLED="NO"):
+        with rasterio.open(thumbnail_name, "w", driver="JPEG", width=rgb.shape[2], height=rgb.shape[1],
+                           count=3, dtype=np.uint8) as dst:
+            dst.write(rgb)
+    return thumbnail_name
 
 
-def apply_overlay(input_file, output_file):
-    try:
-        # remove the filname extension:
-        input_file_without_extension = input_file.split('.')[0]
-        # Burn Rivers
-        command = [
-            "gdal_rasterize",
-            "-b", "1", "-b", "2", "-b", "3",
-            "-burn", "255", "-burn", "255", "-burn", "255",
-            "-l", "overview_rivers_2056",     # Specify layer name
-            config.OVERVIEW_RIVERS,
-            input_file_without_extension+".tif"
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
-
-        # Burn Lakes
-        command = [
-            "gdal_rasterize",
-            "-b", "1", "-b", "2", "-b", "3",
-            "-burn", "255", "-burn", "255", "-burn", "255",
-            "-l", "overview_lakes_2056",     # Specify layer name
-            config.OVERVIEW_LAKES,
-            input_file_without_extension+".tif"
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
-
-        # export to jpg
-        command = [
-            "gdal_translate",
-            "-of", "JPEG",
-            "--config", "GDAL_PAM_ENABLED", "NO",
-            input_file_without_extension+".tif",
-            output_file
-        ]
-        subprocess.run(command, check=True, capture_output=True, text=True)
+def render_rgb_thumbnail(inputfile_name, thumbnail_name):
+    """
+    Renders the thumbnail of the RGB bands (1, 2, 3) of a raster in memory: the bands are stretched between their
+    minimum and maximum with a gamma correction of 0.5, pixels without data are filled in grey inside the buffer of
+    Switzerland (config.BUFFER), then rivers and lakes are overlaid.
 
-        # remove intermediate files
-        [os.remove(file) for file in os.listdir()
-            if file.startswith("output_thumbnail")]
-        return (output_file)
+    Args:
+        inputfile_name (str): Path of the raster.
+        thumbnail_name (str): Path of the JPEG.
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error: {e}")
-        return False
+    Returns:
+        str: Path of the JPEG.
+    """
+    data, crs, transform = read_thumbnail_data(inputfile_name, [1, 2, 3])
+
+    # Stretch the valid values to 0..255, using a gamma correction of 0.5
+    min_value = float(data.min()) if data.count() else 0.0
+    max_value = float(data.max()) if data.count() else 0.0
+    scaled = (data.filled(min_value).astype(np.float32) - min_value) / max(max_value - min_value, 1e-9)
+    rgb = (np.sqrt(np.clip(scaled, 0, 1)) * 255).astype(np.uint8)
+
+    # Fill pixels without data: grey inside Switzerland, black outside
+    no_data = np.ma.getmaskarray(data).any(axis=0) | (rgb == 0).all(axis=0)
+    swiss_fill = np.where(get_cutline_mask(
+        crs, transform, no_data.shape), 220, 0).astype(np.uint8)
+    rgb[:, no_data] = swiss_fill[no_data]
+
+    apply_overlay(rgb, crs, transform)
+    return write_thumbnail_jpeg(rgb, thumbnail_name)
+
+
+def apply_palette(data, palette, rgb=None):
+    """
+    Classifies values into the RGB colors of a palette with a single lookup table pass.
+
+    Args:
+        data (numpy.ndarray): The values, 2D array.
+        palette (dict): The palette, see THUMBNAIL_PALETTES.
+        rgb (numpy.ndarray, optional): Preallocated (3, height, width) uint8 array to write the colors into.
+
+    Returns:
+        numpy.ndarray: The colors as (3, height, width) uint8 array.
+    """
+    # Lookup table: index 0 for the values below the lower limit, then one index per class
+    lut = np.array([(0, 0, 0)] + list(palette["colors"]), dtype=np.uint8)
+
+    # Class of each value: (previous upper limit, upper limit], the first class includes the lower limit
+    classes = np.searchsorted(
+        np.asarray(palette["upper_limits"]), data, side="left") + 1
+    classes[data < palette["lower_limit"]] = 0
+
+    if rgb is None:
+        rgb = np.empty((3,) + data.shape, dtype=np.uint8)
+    for band in range(3):
+        np.take(lut[:, band], classes, out=rgb[band])
+    return rgb
+
+
+def render_palette_thumbnail(inputfile_name, thumbnail_name, palette):
+    """
+    Renders the thumbnail of the first band of a raster in memory, colored with a palette, then overlays rivers and
+    lakes.
+
+    Args:
+        inputfile_name (str): Path of the raster.
+        thumbnail_name (str): Path of the JPEG.
+        palette (dict): The palette, see THUMBNAIL_PALETTES.
+
+    Returns:
+        str: Path of the JPEG.
+    """
+    data, crs, transform = read_thumbnail_data(inputfile_name, [1])
+
+    # No data values are colored like any other value, e.g. 9999 as over 100 for VHI
+    rgb = apply_palette(np.ma.getdata(data[0]), palette)
+
+    apply_overlay(rgb, crs, transform)
+    return write_thumbnail_jpeg(rgb, thumbnail_name)
+
+
+def get_thumbnail_palette(product):
+    """
+    Returns the thumbnail palette of a product, e.g. the palette "ch.swisstopo.swisseo_vhi" for the product
+    "ch.swisstopo.swisseo_vhi_v100".
+
+    Args:
+        product (str): The product name.
+
+    Returns:
+        dict: The palette, see THUMBNAIL_PALETTES, None if the product has no palette.
+    """
+    for product_prefix, palette in THUMBNAIL_PALETTES.items():
+        if product.startswith(product_prefix):
+            return palette
+    return None
 
 
 def create_thumbnail(inputfile_name, product):
@@ -65,186 +324,25 @@ def create_thumbnail(inputfile_name, product):
         #     "bands-10m.tif", "thumbnail.jpeg")
         thumbnail_name = "thumbnail.jpg"
         try:
-            # Export thumbnail
-            command = [
-                "gdal_translate",
-                "-b", "1", "-b", "2", "-b", "3",
-                "-of", "GTiff",
-                "-outsize", "256", "256",
-                inputfile_name,
-                "output_thumbnail.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # to RGB
-            command = [
-                "gdal_translate",
-                "output_thumbnail.tif",
-                "output_thumbnailRGB.tif",
-                "-b", "1", "-b", "2", "-b", "3",
-                "-co", "COMPRESS=DEFLATE",
-                "-co", "PHOTOMETRIC=RGB"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Get Min Max Value to strecth the image
-            with rasterio.open("output_thumbnailRGB.tif") as rgb_range:
-                min_value = str(round(rgb_range.read().min()))
-                max_value = str(round(rgb_range.read().max()))
-
-            # scale the view, using a gamma correction of 0.5
-            command = [
-                "gdal_translate",
-                "output_thumbnailRGB.tif",
-                "output_thumbnailRGB_scaled.tif",
-                "-scale", min_value, max_value, "0", "65535",
-                "-exponent", "0.5",
-                "-co", "COMPRESS=DEFLATE",
-                "-co", "PHOTOMETRIC=RGB"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # make a geotiff
-            command = [
-                "gdal_translate",
-                "-of", "GTiff",
-                "-ot", "Byte",
-                "-outsize", "256", "256",
-                "-scale", "0", "65535", "0", "255",
-                "output_thumbnailRGB_scaled.tif",
-                "output_thumbnailRGB_scaled255.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Fill Buffer Switzerland
-            command = [
-                "gdal_rasterize",
-                "-burn", "220", "-burn", "220", "-burn", "220",
-                "-init", "0",
-                "-a_nodata", "0",
-                "-l", "ch_buffer_5000m",
-                config.BUFFER,
-                "-ot", "Byte",
-                "-of", "GTiff",
-                "-ts", "1024", "1024",
-                "output_thumbnailswissfill.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Set 0 values to nodata
-            command = [
-                "gdal_translate",
-                "-a_nodata", "0,0,0",
-                "output_thumbnailRGB_scaled255.tif",
-                "output_thumbnailRGB_scaled255nodata.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # overlay on Switzerland
-            command = [
-                "gdalwarp",
-                "-overwrite",
-                "-dstnodata", "0",
-                "output_thumbnailswissfill.tif",
-                "output_thumbnailRGB_scaled255nodata.tif",
-                "output_thumbnailRGB_scaled255nodata_merged.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Get the dimensions/ As
-            # TODO should be output_thumbnailRGB_scaled255nodata_merged.tif then also add -ts below
-            with rasterio.open("output_thumbnailRGB_scaled255nodata.tif") as swiss:
-
-                # Calculate the new width to maintain the aspect ratio with a height of 256 pixels
-                new_width = str(int((swiss.width * 256) / swiss.height))
-
-            # clip to extent of products
-            with rasterio.open("output_thumbnailRGB.tif") as subset:
-                bboxl = str(int(subset.bounds.left))
-                bboxb = str(int(subset.bounds.bottom))
-                bboxr = str(int(subset.bounds.right))
-                bboxt = str(int(subset.bounds.top))
-            command = [
-                "gdalwarp",
-                "-overwrite",
-                "-te", bboxl, bboxb, bboxr, bboxt,
-                # "-ts", new_width, "256",
-                "output_thumbnailRGB_scaled255nodata_merged.tif",
-                "output_thumbnailRGB_scaled255nodata_clipped.tif"
-            ]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB_scaled255nodata_clipped.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
+            thumbnail_name = render_rgb_thumbnail(
+                inputfile_name, thumbnail_name)
+
+        except (rasterio.errors.RasterioError, fiona.errors.FionaError, ValueError) as e:
             print(f"Error: {e}")
             return False
 
-    # VHI Use case
-    elif product.startswith("ch.swisstopo.swisseo_vhi") and inputfile_name.endswith("bands-10m.tif"):
+    # Products with a palette, e.g. VHI
+    elif get_thumbnail_palette(product) is not None and inputfile_name.endswith("bands-10m.tif"):
         # https://github.com/radiantearth/stac-spec/blob/master/best-practices.md#visual
         # It should be called just   "thumbnail.jpg"
         # thumbnail_name = inputfile_name.replace(
         #     "bands-10m.tif", "thumbnail.jpeg")
         thumbnail_name = "thumbnail.jpg"
         try:
+            thumbnail_name = render_palette_thumbnail(
+                inputfile_name, thumbnail_name, get_thumbnail_palette(product))
 
-            src = rasterio.open(inputfile_name)
-            # Define the width of the thumbnail
-            thumbnail_width = 256
-
-            # Calculate the height to maintain aspect ratio
-            aspect_ratio = src.height / src.width
-            thumbnail_height = int(thumbnail_width * aspect_ratio)
-
-            # Read a subset of the data directly from the GeoTIFF
-            data = src.read(out_shape=(
-                src.count, thumbnail_height, thumbnail_width))
-
-            # Create a new GeoTIFF file for the thumbnail
-            output_file = "output_thumbnail.tif"
-            with rasterio.open(output_file, 'w', driver='GTiff', width=thumbnail_width, height=thumbnail_height, count=src.count, dtype=src.dtypes[0], crs=src.crs, transform=from_origin(src.bounds.left, src.bounds.top, src.transform.a, src.transform.e)) as dst:
-                dst.write(data)
-
-            # Define color map
-            color_map = {
-                (0, 10): (181, 106, 41),    # [0,10] extremely dry - dark brown
-                (10, 20): (206, 133, 64),   # (10,20] severely dry - brown
-                (20, 30): (245, 205, 133),  # (20,30] moderately dry - beige
-                (30, 40): (255, 245, 186),  # (30,40] mild dry - yellow
-                (40, 50): (203, 255, 202),  # (40,50] normal - light green
-                (50, 60): (82, 189, 159),   # (50,60] good - green
-                (60, 100): (4, 112, 176),   # (60,100] excellent - blue
-                (100, np.inf): (128, 128, 128)  # Values over 100 - gray
-            }
-
-            # Load TIFF file
-            with rasterio.open('output_thumbnail.tif') as src:
-                data = src.read(1)  # Assuming single band
-                profile = src.profile
-                # Update profile for 3 bands and uint8 dtype
-                profile.update(count=3, dtype=rasterio.uint8)
-
-            # Apply color mapping
-            data_rgb = np.zeros(
-                (3, data.shape[0], data.shape[1]), dtype=np.uint8)
-            for value_range, color in color_map.items():
-                mask = np.logical_and(
-                    data >= value_range[0], data <= value_range[1])
-                for i in range(3):
-                    data_rgb[i][mask] = color[i]
-
-            # Write RGB image
-            with rasterio.open('output_thumbnailRGB.tif', 'w', **profile) as dst:
-                dst.write(data_rgb)
-
-            # Apply overlay and create JPG
-            thumbnail_name = apply_overlay(
-                "output_thumbnailRGB.tif", thumbnail_name)
-
-        except subprocess.CalledProcessError as e:
+        except (rasterio.errors.RasterioError, fiona.errors.FionaError, ValueError) as e:
             print(f"Error: {e}")
             return False
     else:
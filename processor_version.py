@@ -0,0 +1,155 @@
+"""
+Version of the processor (commit and release), used in the metadata of the products.
+
+The module only uses the standard library, so that the processors can read the version without importing the raster
+stack of main_functions.
+"""
+import os
+import json
+import time
+import subprocess
+import urllib.request
+import configuration as config
+
+# Processor version resolved once per process, see get_github_info()
+github_info_cache = None
+
+
+def get_git_output(args):
+    """
+    Runs a git command in the local checkout of the processor.
+
+    Args:
+        args (list): Arguments passed to git, e.g. ["rev-parse", "HEAD"].
+
+    Returns:
+        str: The stripped output of the command, None if git is not available or the command fails.
+    """
+    try:
+        result = subprocess.run(["git"] + args, check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def read_github_info_cache():
+    """
+    Reads the processor version from the on-disk cache if it is younger than the configured TTL.
+
+    Returns:
+        dict: The cached processor version, None if there is no valid cache.
+    """
+    cache_file = config.PROCESSOR_VERSION_CACHE
+    if not os.path.isfile(cache_file):
+        return None
+    if time.time() - os.path.getmtime(cache_file) > config.PROCESSOR_VERSION_CACHE_TTL:
+        return None
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def request_github_json(url):
+    """
+    Sends a GET request to the GitHub API.
+
+    Args:
+        url (str): The URL of the GitHub API resource.
+
+    Returns:
+        dict: The JSON response.
+    """
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+
+def request_github_info(owner, repo):
+    """
+    Retrieves the latest commit hash of main and the latest release from the GitHub API.
+
+    Args:
+        owner (str): Owner of the GitHub repository.
+        repo (str): Name of the GitHub repository.
+
+    Returns:
+        tuple: The commit hash and the release version, each None if the request fails.
+    """
+    commit_hash = None
+    release_version = None
+    try:
+        # Make a GET request to the GitHub API to retrieve information about the repository
+        commit_hash = request_github_json(
+            f"https://api.github.com/repos/{owner}/{repo}/commits/main")["sha"]
+
+        # Make a GET request to the GitHub API to retrieve information about the repository releases
+        release_version = request_github_json(
+            f"https://api.github.com/repos/{owner}/{repo}/releases/latest")["tag_name"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"GitHub API not reachable: {e}")
+
+    return commit_hash, release_version
+
+
+def get_github_info():
+    """
+    Retrieves the processor version and generates a GitHub link based on the commit in use.
+
+    The version is resolved only once per process. The commit hash and release are taken from the
+    environment (GITHUB_SHA, SATROMO_RELEASE_VERSION) or the local git checkout. Only if this is not
+    sufficient, the on-disk cache (config.PROCESSOR_VERSION_CACHE) or finally the GitHub API is used.
+
+    Note that the release of the local checkout is the nearest tag reachable from the checked out commit
+    (git describe), i.e. the release the running code is based on. It is not necessarily the latest release
+    on GitHub, which is what the API fallback returns.
+
+    Returns:
+        A dictionary containing the GitHub link and the release version. If no commit hash is available,
+        the link will be None and if no release is available, the release version will be "0.0.0".
+    """
+    global github_info_cache
+    if github_info_cache is not None:
+        return github_info_cache
+
+    # Enter your GitHub repository information
+    owner = config.GITHUB_OWNER
+    repo = config.GITHUB_REPO
+
+    # Prefer the environment (GitHub Action) and the local checkout, they do not need any network access
+    commit_hash = os.environ.get("GITHUB_SHA") or get_git_output(["rev-parse", "HEAD"])
+    release_version = os.environ.get("SATROMO_RELEASE_VERSION") or get_git_output(
+        ["describe", "--tags", "--abbrev=0"])
+
+    if commit_hash is None or release_version is None:
+        cached_info = read_github_info_cache()
+        if cached_info is not None:
+            commit_hash = commit_hash or cached_info["CommitHash"]
+            release_version = release_version or cached_info["ReleaseVersion"]
+        else:
+            api_commit_hash, api_release_version = request_github_info(owner, repo)
+            # Only cache complete answers, so that a failed request is retried on the next run
+            if api_commit_hash is not None and api_release_version is not None:
+                try:
+                    os.makedirs(os.path.dirname(config.PROCESSOR_VERSION_CACHE), exist_ok=True)
+                    with open(config.PROCESSOR_VERSION_CACHE, "w") as f:
+                        json.dump({"CommitHash": api_commit_hash,
+                                  "ReleaseVersion": api_release_version}, f)
+                except OSError as e:
+                    print(f"Processor version cache not written: {e}")
+            commit_hash = commit_hash or api_commit_hash
+            release_version = release_version or api_release_version
+
+    github_info = {}
+
+    # Generate the GitHub link
+    if commit_hash is not None:
+        github_info["GithubLink"] = f"https://github.com/{owner}/{repo}/commit/{commit_hash}"
+    else:
+        github_info["GithubLink"] = None
+
+    github_info["ReleaseVersion"] = release_version or "0.0.0"
+
+    github_info_cache = github_info
+    return github_info
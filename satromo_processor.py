@@ -1,17 +1,26 @@
 # -*- coding: utf-8 -*-
 import sys
 from pydrive.auth import GoogleAuth
-import csv
 from oauth2client.service_account import ServiceAccountCredentials
 import datetime
-import requests
-import csv
+import math
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import os
 import ee
+from googleapiclient.errors import HttpError
 import configuration as config
 from step0_functions import get_step0_dict, step0_main
-import pandas as pd
+from processor_version import get_github_info
+import state_store
+
+# Assets queued by prepare_export with their export tasks, started and recorded by submit_exports
+export_queue = []
+
+# Products of the configuration, built once by get_product_registry()
+product_registry = None
 
 
 def determine_run_type():
@@ -30,49 +39,6 @@ def determine_run_type():
         print("\nType 1 run PROCESSOR: We are on INT")
 
 
-def get_github_info():
-    """
-    Retrieves GitHub repository information and generates a GitHub link based on the latest commit.
-
-    Returns:
-        A dictionary containing the GitHub link. If the request fails or no commit hash is available, the link will be None.
-    """
-    # Enter your GitHub repository information
-    owner = config.GITHUB_OWNER
-    repo = config.GITHUB_REPO
-
-    # Make a GET request to the GitHub API to retrieve information about the repository
-    response = requests.get(
-        f"https://api.github.com/repos/{owner}/{repo}/commits/main")
-
-    github_info = {}
-
-    if response.status_code == 200:
-        # Extract the commit hash from the response
-        commit_hash = response.json()["sha"]
-
-        # Generate the GitHub link
-        github_link = f"https://github.com/{owner}/{repo}/commit/{commit_hash}"
-        github_info["GithubLink"] = github_link
-
-    else:
-        github_info["GithubLink"] = None
-
-    # Make a GET request to the GitHub API to retrieve information about the repository releases
-    response = requests.get(
-        f"https://api.github.com/repos/{owner}/{repo}/releases/latest")
-
-    if response.status_code == 200:
-        # Extract the release version from the response
-        release_version = response.json()["tag_name"]
-    else:
-        release_version = "0.0.0"
-
-    github_info["ReleaseVersion"] = release_version
-
-    return github_info
-
-
 def initialize_gee_and_drive():
     """
     Initializes Google Earth Engine (GEE) and Google Drive based on the run type.
@@ -138,35 +104,65 @@ def initialize_gee_and_drive():
         print("GEE initialization FAILED")
 
 
-def get_product_from_techname(techname):
+def build_product_registry():
     """
-    This function searches for a dictionary in the 'config' module that contains 
-    'product_name' with a specified value and returns it.
+    Build the product registry from the configuration.
 
-    Parameters:
-    techname (str): The value of 'product_name' to search for. 
-                    For example, 'ch.swisstopo.swisseo_s2-sr_v100'.
+    The 'config' module is scanned once for product dictionaries (dictionaries containing
+    'product_name'). Every product is indexed by its config key (e.g. 'PRODUCT_NDVI_MAX')
+    and by its 'product_name', together with the processing function and ROI registered in
+    PRODUCT_HANDLERS.
 
     Returns:
-    dict: The dictionary that contains 'product_name' with the value of 'techname'. 
-          If no such dictionary is found, it returns None.
+    tuple: Two dictionaries, the products by config key and the products by product name.
+           Each product is a dictionary with the entries 'config', 'handler' and 'roi'.
     """
-
-    # Initialize the variable to None
-    var = None
+    products_by_key = {}
+    products_by_name = {}
 
     # Iterate over all attributes in the config module
     for attr_name in dir(config):
         attr_value = getattr(config, attr_name)
 
-        # Check if the attribute is a dictionary
-        if isinstance(attr_value, dict):
-            # Check if the dictionary contains 'product_name' with the desired value
-            if attr_value.get('product_name') == techname:
-                var = attr_value
-                break  # Exit the loop once the dictionary is found
+        # Check if the attribute is a product dictionary
+        if isinstance(attr_value, dict) and 'product_name' in attr_value:
+            handler, roi = PRODUCT_HANDLERS.get(attr_name, (None, None))
+            product = {'config': attr_value, 'handler': handler, 'roi': roi}
+            products_by_key[attr_name] = product
+            products_by_name[attr_value['product_name']] = product
+
+    return products_by_key, products_by_name
+
 
-    return var
+def get_product_registry():
+    """
+    Returns the product registry, building it on first use.
+
+    Returns:
+    tuple: The products by config key and the products by product name, see build_product_registry().
+    """
+    global product_registry
+    if product_registry is None:
+        product_registry = build_product_registry()
+    return product_registry
+
+
+def get_product_from_techname(techname):
+    """
+    This function returns the dictionary in the 'config' module that contains
+    'product_name' with a specified value.
+
+    Parameters:
+    techname (str): The value of 'product_name' to search for. 
+                    For example, 'ch.swisstopo.swisseo_s2-sr_v100'.
+
+    Returns:
+    dict: The dictionary that contains 'product_name' with the value of 'techname'. 
+          If no such dictionary is found, it returns None.
+    """
+    _, products_by_name = get_product_registry()
+    product = products_by_name.get(techname)
+    return product['config'] if product is not None else None
 
 
 def maskOutside(image, aoi):
@@ -194,44 +190,77 @@ def get_collection_info(collection):
     """
     Retrieves information about an image collection.
 
+    All statistics are combined into a single server-side dictionary so that
+    only one getInfo() round trip to GEE is needed.
+
     Args:
         collection: The image collection to retrieve information from.
 
     Returns:
-        A tuple containing the first date, last date, and total number of images in the collection.
+        A tuple containing the first date, last date, total number of images and
+        the list of 'system:index' values of the collection.
+        First and last date are None if the collection is empty.
     """
-    # Sort the collection by date in ascending order
-    sorted_collection = collection.sort('system:time_start')
+    # Get the count of images in the filtered collection
+    image_count = collection.size()
 
-    # Get the first and last image from the sorted collection
-    first_image = sorted_collection.first()
-    last_image = sorted_collection.sort('system:time_start', False).first()
+    # Get the first and last acquisition time of the collection
+    time_start_min = collection.aggregate_min('system:time_start')
+    time_start_max = collection.aggregate_max('system:time_start')
 
-    # Get the dates of the first and last image
-    first_date = ee.Date(first_image.get('system:time_start')
-                         ).format('YYYY-MM-dd').getInfo()
-    last_date = ee.Date(last_image.get('system:time_start')
-                        ).format('YYYY-MM-dd').getInfo()
+    # Combine everything in one dictionary, dates are only formatted if there are images
+    collection_info = ee.Dictionary({
+        'first_date': ee.Algorithms.If(image_count.gt(0), ee.Date(time_start_min).format('YYYY-MM-dd'), None),
+        'last_date': ee.Algorithms.If(image_count.gt(0), ee.Date(time_start_max).format('YYYY-MM-dd'), None),
+        'total_scenes': image_count,
+        'index_list': collection.aggregate_array('system:index')
+    }).getInfo()
 
-    # Get the count of images in the filtered collection
-    image_count = collection.size()
+    # Return the first date, last date, total number of scenes and the asset indexes
+    return (collection_info['first_date'], collection_info['last_date'],
+            collection_info['total_scenes'], collection_info['index_list'])
 
-    # Get the scenes count
-    total_scenes = image_count.getInfo()
 
-    # Return the first date, last date, and total number of scenes
-    return first_date, last_date, total_scenes
+def get_band_bytes(band):
+    """
+    Estimate the number of bytes per pixel of an image band.
 
+    Parameters:
+    band (dict): Band description as returned by ee.Image.getInfo()['bands'].
 
-def get_quadrants(roi):
+    Returns:
+    int: Number of bytes per pixel needed to store the band.
     """
-    Divide a region of interest into quadrants.
+    data_type = band.get('data_type', {})
+    if data_type.get('precision') == 'double':
+        return 8
+    if data_type.get('precision') == 'float':
+        return 4
+
+    # Integer bands: derive the size from the value range
+    value_range = data_type.get('max', 2 ** 31) - data_type.get('min', 0)
+    if value_range < 2 ** 8:
+        return 1
+    if value_range < 2 ** 16:
+        return 2
+    return 4
+
+
+def get_quadrants(roi, scale, bytes_per_pixel):
+    """
+    Divide a region of interest into a grid of tiles sized by the export budget.
+
+    The number of tiles is chosen so that every export task stays below
+    config.EXPORT_MAX_BYTES_PER_TASK: a small AOI is exported as a single tile,
+    a national multiband mosaic as a grid of N x M tiles of similar shape.
 
     Parameters:
     roi (ee.Geometry): Region of interest.
+    scale (int): Scale of the export in meters.
+    bytes_per_pixel (int): Size of one pixel over all bands in bytes.
 
     Returns:
-    dict: Dictionary with the quadrants (quadrant1, quadrant2, quadrant3, quadrant4).
+    dict: Dictionary with the tiles (quadrant1, quadrant2, ..., quadrantN), row by row from the lower left corner.
     """
     # Calculate the bounding box of the region
     bounds = roi.bounds()
@@ -244,29 +273,39 @@ def get_quadrants(roi):
     min_x, min_y = bbox[0]
     max_x, max_y = bbox[2]
 
-    # Calculate the midpoints
-    mid_x = (min_x + max_x) / 2
-    mid_y = (min_y + max_y) / 2
-
-    # Define the quadrants
-    quadrant1 = ee.Geometry.Rectangle(min_x, min_y, mid_x, mid_y)
-    quadrant2 = ee.Geometry.Rectangle(mid_x, min_y, max_x, mid_y)
-    quadrant3 = ee.Geometry.Rectangle(min_x, mid_y, mid_x, max_y)
-    quadrant4 = ee.Geometry.Rectangle(mid_x, mid_y, max_x, max_y)
-
-    return {
-        "quadrant1": quadrant1,
-        "quadrant2": quadrant2,
-        "quadrant3": quadrant3,
-        "quadrant4": quadrant4
-    }
+    # Approximate extent of the bounding box in meters
+    width = max((max_x - min_x) * 111320 *
+                math.cos(math.radians((min_y + max_y) / 2)), scale)
+    height = max((max_y - min_y) * 110574, scale)
+
+    # Number of tiles needed to stay within the budget per task
+    export_bytes = (width / scale) * (height / scale) * bytes_per_pixel
+    number_of_tiles = max(
+        1, math.ceil(export_bytes / config.EXPORT_MAX_BYTES_PER_TASK))
+
+    # Grid with tiles as square as possible
+    columns = min(number_of_tiles, max(
+        1, round(math.sqrt(number_of_tiles * width / height))))
+    rows = math.ceil(number_of_tiles / columns)
+
+    step_x = (max_x - min_x) / columns
+    step_y = (max_y - min_y) / rows
+
+    # Define the tiles, the naming "quadrant" is kept for the publisher
+    quadrants = {}
+    for row in range(rows):
+        for column in range(columns):
+            quadrants["quadrant" + str(len(quadrants) + 1)] = ee.Geometry.Rectangle(
+                min_x + column * step_x, min_y + row * step_y,
+                min_x + (column + 1) * step_x, min_y + (row + 1) * step_y)
+
+    return quadrants
 
 
 def start_export(image, scale, description, region, filename_prefix, crs):
     """
     Starts an export task to export an image to Google Drive.
 
-
     Args:
         image: The image to be exported.
         scale: The scale of the exported image.
@@ -276,7 +315,7 @@ def start_export(image, scale, description, region, filename_prefix, crs):
         crs: The coordinate reference system (CRS) of the exported image.
 
     Returns:
-        None
+        tuple: The Task ID and the filename prefix of the started export.
     """
 
     # Export in GEE
@@ -322,28 +361,99 @@ def start_export(image, scale, description, region, filename_prefix, crs):
     #     crsTransform = projection['transform']
     # )
 
-    task.start()
-
-    # Get Task ID
-    task_id = task.status()["id"]
+    # Start the task, retry with exponential backoff if GEE refuses or fails the request,
+    # or if the connection to GEE fails (HTTP errors, timeouts, socket errors).
+    # The task keeps its request id between attempts, so a retry does not start a second export.
+    for attempt in range(config.EXPORT_MAX_ATTEMPTS):
+        try:
+            task.start()
+            break
+        except (ee.EEException, HttpError, OSError) as e:
+            if attempt == config.EXPORT_MAX_ATTEMPTS - 1:
+                raise
+            wait = config.EXPORT_RETRY_BACKOFF * 2 ** attempt
+            print(f"Starting export {filename_prefix} failed ({e}), retrying in {wait}s")
+            time.sleep(wait)
+
+    # Get Task ID, it is set by task.start() so no additional status request is needed
+    task_id = task.id
     print("Exporting  with Task ID:", task_id + f" file {filename_prefix}...")
 
-    # Save Task ID and filename to a text file
-    header = ["Task ID", "Filename"]
-    data = [task_id, filename_prefix]
+    return task_id, filename_prefix
 
-    # Check if the file already exists
-    file_exists = os.path.isfile(config.GEE_RUNNING_TASKS)
 
-    with open(config.GEE_RUNNING_TASKS, "a", newline="") as f:
-        writer = csv.writer(f)
+def submit_exports():
+    """
+    Submits all export tasks queued by prepare_export concurrently.
+
+    The exports are started in a thread pool bounded by config.EXPORT_MAX_WORKERS, each one with
+    retry and backoff (see start_export). Exports which could not be started are reported and do
+    not stop the others.
 
-        # Write the header if the file is newly created
-        if not file_exists:
-            writer.writerow(header)
+    A product is only recorded once all of its exports have started: its Task IDs are written to
+    the running tasks, its status to the product updates and its metadata JSON files to the
+    processing directory. If any export of a product fails to start, the already started exports
+    of that product are cancelled and nothing is recorded, so the product is processed again on
+    the next run.
 
-        # Write the data
-        writer.writerow(data)
+    Returns:
+        int: Number of started exports.
+    """
+    # Take all queued products at once, products queued from now on go to the next submission
+    product_jobs = export_queue[:]
+    del export_queue[:len(product_jobs)]
+    if not product_jobs:
+        return 0
+
+    # Group the queued assets by product, a product may consist of several assets
+    products = {}
+    for product_job in product_jobs:
+        products.setdefault(
+            product_job['product_status']['Product'], []).append(product_job)
+
+    started = {}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=config.EXPORT_MAX_WORKERS) as executor:
+        futures = {executor.submit(start_export, **export_job): (productname, export_job)
+                   for productname, assets in products.items()
+                   for asset in assets
+                   for export_job in asset['exports']}
+        for future in as_completed(futures):
+            productname, export_job = futures[future]
+            try:
+                started.setdefault(productname, []).append(future.result())
+            except Exception as e:
+                failed.add(productname)
+                print(
+                    f"Export {export_job['filename_prefix']} could NOT be started: {e}")
+
+    running_tasks = []
+    for productname, assets in products.items():
+        if productname in failed:
+            # Cancel the started exports, a partial product would never be complete for the publisher
+            for task_id, filename_prefix in started.get(productname, []):
+                try:
+                    ee.data.cancelTask(task_id)
+                except Exception as e:
+                    print(f"Export {filename_prefix} could NOT be cancelled: {e}")
+            print(f"{productname} NOT recorded, it is processed again on the next run")
+            continue
+
+        running_tasks.extend(started[productname])
+
+        # Write the metadata of each asset
+        for asset in assets:
+            with open(asset['metadata_file'], 'w') as json_file:
+                json.dump(asset['metadata'], json_file)
+
+        # Update the product status in the state store
+        state_store.set_product_update(assets[-1]['product_status'])
+
+    # Save Task IDs and filenames to the running tasks in a single transaction
+    state_store.add_running_tasks(running_tasks)
+
+    print(f"{len(running_tasks)} of {len(futures)} exports started")
+    return len(running_tasks)
 
 
 def check_product_status(product_name):
@@ -357,13 +467,8 @@ def check_product_status(product_name):
     bool: True if "Status" has a value equal to 'complete'
     False otherwise
     """
-
-    with open(config.LAST_PRODUCT_UPDATES, "r", newline="", encoding="utf-8") as f:
-        dict_reader = csv.DictReader(f, delimiter=",")
-        for row in dict_reader:
-            if row["Product"] == product_name:
-                return row['Status'] == 'complete'
-    return False
+    product_update = state_store.get_product_update(product_name)
+    return product_update is not None and product_update['Status'] == 'complete'
 
 
 def check_product_update(product_name, date_string):
@@ -380,74 +485,19 @@ def check_product_update(product_name, date_string):
     """
     target_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
 
-    with open(config.LAST_PRODUCT_UPDATES, "r", newline="", encoding="utf-8") as f:
-        dict_reader = csv.DictReader(f, delimiter=",")
-        for row in dict_reader:
-            if row["Product"] == product_name:
-                last_scene_date = datetime.datetime.strptime(
-                    row["LastSceneDate"], "%Y-%m-%d").date()
-                return last_scene_date < target_date
-    return True
-
-
-def update_product_status_file(input_dict, output_file):
-    """
-    Write a dictionary to a CSV file. If the file exists, the data is appended to it.
-    If the file does not exist, a new file is created with a header. The function also
-    updates the dictionary entry for the "Product" field.
-
-    Args:
-        input_dict (dict): Dictionary to be written to the file.
-        output_file (str): Path of the output file.
-
-    Returns:
-        None
-    """
-    # Get the field names from the input dictionary
-    fieldnames = list(input_dict.keys())
-
-    if os.path.isfile(output_file):
-        # If the file already exists, update the existing data or append new data
-        with open(output_file, "r+", newline="", encoding="utf-8") as f:
-            dict_reader = csv.DictReader(f, delimiter=",")
-            lines = list(dict_reader)
-            product_exists = False
-            for i, line in enumerate(lines):
-                if line["Product"] == input_dict["Product"]:
-                    lines[i] = input_dict
-                    product_exists = True
-                    break
-            if not product_exists:
-                lines.append(input_dict)
-
-            # Move the file pointer to the beginning
-            f.seek(0)
-            dict_writer = csv.DictWriter(
-                f, fieldnames=fieldnames, delimiter=",", quotechar='"', lineterminator="\n"
-            )
-            dict_writer.writeheader()
-            dict_writer.writerows(lines)
-
-            # Truncate the file to remove any remaining data
-            f.truncate()
-    else:
-        # If the file doesn't exist, create a new file and write the header and data
-        with open(output_file, "w", newline="", encoding="utf-8") as f:
-            dict_writer = csv.DictWriter(
-                f, fieldnames=fieldnames, delimiter=",", quotechar='"', lineterminator="\n"
-            )
-            dict_writer.writeheader()
-            dict_writer.writerow(input_dict)
-
-    # Return None
-    return None
+    product_update = state_store.get_product_update(product_name)
+    if product_update is None:
+        return True
+    last_scene_date = datetime.datetime.strptime(
+        product_update["LastSceneDate"], "%Y-%m-%d").date()
+    return last_scene_date < target_date
 
 
 def prepare_export(roi, productitem, productasset, productname, scale, image, sensor_stats, current_date_str):
     """
-    Prepare the export of the image by splitting it into quadrants and starting the export tasks.
-    It also generates product status information, updates the product status file,
-    and writes the product description to a CSV file.
+    Prepare the export of the image by splitting it into tiles and queuing the export tasks.
+    It also generates the product status information and the product metadata, which are queued
+    with the exports and recorded by submit_exports() once all exports of the product have started.
 
     Args:
         roi (ee.Geometry): Region of interest for the export.
@@ -466,9 +516,15 @@ def prepare_export(roi, productitem, productasset, productname, scale, image, se
     # Get current Processor Version from GitHub
     processor_version = get_github_info()
 
-    # Define the quadrants to split into 4 regions
-    quadrants = get_quadrants(roi)
+    # Adding extracting image info
+    image_info = ee.Image(image).getInfo()
+
+    # Define the tiles to split into, according to the size of the export
+    bytes_per_pixel = sum(get_band_bytes(band)
+                          for band in image_info['bands'])
+    quadrants = get_quadrants(roi, int(scale), bytes_per_pixel)
 
+    export_jobs = []
     for quadrant_name, quadrant in quadrants.items():
         # Create filename for each quadrant
         filename_q = productasset + quadrant_name
@@ -476,8 +532,15 @@ def prepare_export(roi, productitem, productasset, productname, scale, image, se
 
         # start_export(image, int(scale),
         #              "P:" + productname + " I:" + productasset, quadrant, filename_q, config.OUTPUT_CRS)
-        start_export(image, int(scale),
-                     productasset, quadrant, filename_q, config.OUTPUT_CRS)
+        # Queue the export, all exports of the run are started together by submit_exports()
+        export_jobs.append({
+            'image': image,
+            'scale': int(scale),
+            'description': productasset,
+            'region': quadrant,
+            'filename_prefix': filename_q,
+            'crs': config.OUTPUT_CRS
+        })
 
     # Generate product status information
     product_status = {
@@ -487,17 +550,14 @@ def prepare_export(roi, productitem, productasset, productname, scale, image, se
         'Status': "RUNNING"
     }
 
-    # Update the product status file
-    update_product_status_file(product_status, config.LAST_PRODUCT_UPDATES)
-
     # Get Product info from config
     product = get_product_from_techname(productname)
 
     # Update the product  file
     header = ["Product", "Item", "Asset", "DateFirstScene", "DateLastScene",
-              "NumberOfScenes", "DateItemGeneration", "ProcessorHashLink", "ProcessorReleaseVersion", "GeocatID"]
+              "NumberOfScenes", "DateItemGeneration", "ProcessorHashLink", "ProcessorReleaseVersion", "GeocatID", "NumberOfTiles"]
     data = [productname, productitem, productasset, str(sensor_stats[0]), str(
-        sensor_stats[1]), str(sensor_stats[2]), current_date_str, processor_version["GithubLink"], processor_version["ReleaseVersion"], product['geocat_id']]
+        sensor_stats[1]), str(sensor_stats[2]), current_date_str, processor_version["GithubLink"], processor_version["ReleaseVersion"], product['geocat_id'], len(quadrants)]
 
     # Create swisstopo_data dictionary
     swisstopo_data = {"header": header, "data": data}
@@ -505,9 +565,6 @@ def prepare_export(roi, productitem, productasset, productname, scale, image, se
     # Create swisstopo_data dictionary with uppercase keys
     swisstopo_data = {key.upper(): value for key, value in zip(header, data)}
 
-    # Adding extracting image info
-    image_info = ee.Image(image).getInfo()
-
     # Convert keys to uppercase and add prefix
     image_info_gee = {"GEE_" + key.upper(): value for key,
                       value in image_info.items()}
@@ -515,9 +572,14 @@ def prepare_export(roi, productitem, productasset, productname, scale, image, se
     # Add swisstopo_data to image_info_gee
     image_info_gee["SWISSTOPO"] = swisstopo_data
 
-    # Export the dictionary as JSON
-    with open(os.path.join(config.PROCESSING_DIR, productasset + "_metadata.json"), 'w') as json_file:
-        json.dump(image_info_gee, json_file)
+    # Queue the exports together with the product status and the metadata JSON, both are
+    # only written by submit_exports() once all exports of the product have started
+    export_queue.append({
+        'exports': export_jobs,
+        'product_status': product_status,
+        'metadata_file': os.path.join(config.PROCESSING_DIR, productasset + "_metadata.json"),
+        'metadata': image_info_gee
+    })
 
     # Write the product description to a CSV file
     # with open(os.path.join(config.PROCESSING_DIR, productasset + ".csv"), "w", newline="") as f:
@@ -581,6 +643,11 @@ def process_NDVI_MAX(roi):
     # Get information about the available sensor data for the range
     sensor_stats = get_collection_info(sensor)
 
+    # Check if there are any new imagery
+    if sensor_stats[2] == 0:
+        print("no new imagery")
+        return 0
+
     # Check if there is new sensor data compared to the stored dataset
     if check_product_update(config.PRODUCT_NDVI_MAX['product_name'], sensor_stats[1]) is True:
         print("new imagery from: "+sensor_stats[1])
@@ -638,37 +705,37 @@ def process_S2_LEVEL_2A(roi):
         .filterDate(start_date, end_date)
         .filterBounds(roi)
     )
+    # Get information about the available sensor data for the range
+    sensor_stats = get_collection_info(collection)
+
     # Get the number of images found in the collection
-    num_images = collection.size().getInfo()
+    num_images = sensor_stats[2]
     # Check if there are any new imagery
     if num_images == 0:
         print("no new imagery")
         return 0
 
-    # Get information about the available sensor data for the range
-    sensor_stats = get_collection_info(collection)
-
     # Check if there is new sensor data compared to the stored dataset
     if check_product_update(config.PRODUCT_S2_LEVEL_2A['product_name'], sensor_stats[1]) is True:
         # Get the list of images
-        image_list = collection.toList(collection.size())
-        print(str(image_list.size().getInfo()) + " new image(s) for: " +
+        image_list = collection.toList(num_images)
+        print(str(num_images) + " new image(s) for: " +
               sensor_stats[1] + " to: "+current_date_str)
 
+        # The ids of all images are the asset indexes fetched by get_collection_info, in the order of the list
+        image_ids = sensor_stats[3]
+
         # Print the names of the assets
-        for i in range(num_images):
-            image = ee.Image(image_list.get(i))
-            asset_name = image.get('system:index').getInfo()
-            print(f"Mosaic {i + 1} - Custom Asset Name: {asset_name}")
+        for i, image_id in enumerate(image_ids):
+            print(f"Mosaic {i + 1} - Custom Asset Name: {image_id}")
 
         # Export the different bands
-        for i in range(num_images):
+        for i, image_id in enumerate(image_ids):
             # Generate the mosaic name and sensing date by geeting EE asset ids from the first image
-            mosaic_id = ee.Image(image_list.get(i))
-            mosaic_id = mosaic_id.id().getInfo()
+            mosaic_id = image_id
             mosaic_sensing_timestamp = mosaic_id.split('_')[2]
 
-            clipped_image = ee.Image(collection.toList(num_images).get(i))
+            clipped_image = ee.Image(image_list.get(i))
             # step0 No need to mosaic an clip since with step0 it is already clipped
 
             # Create a mosaic of the images for the specified date and time
@@ -812,157 +879,6 @@ def process_S2_LEVEL_2A(roi):
                                multiband_export, sensor_stats, processing_date)
 
 
-def process_S2_LEVEL_1C(roi):
-    """
-    Export the S2 Level 1C product.
-
-    Returns:
-        None
-    """
-    product_name = config.PRODUCT_S2_LEVEL_1C['product_name']
-    print("********* processing {} *********".format(product_name))
-
-    # Filter the sensor collection based on date and region
-    start_date = ee.Date(
-        current_date).advance(-int(config.PRODUCT_S2_LEVEL_1C['temporal_coverage'])+1, 'day')
-    end_date = ee.Date(current_date).advance(1, 'day')
-
-    collection = (
-        ee.ImageCollection(config.PRODUCT_S2_LEVEL_1C['step0_collection'])
-        .filterDate(start_date, end_date)
-        .filterBounds(roi)
-    )
-    # Get the number of images found in the collection
-    num_images = collection.size().getInfo()
-    # Check if there are any new imagery
-    if num_images == 0:
-        print("no new imagery")
-        return 0
-
-    # Get information about the available sensor data for the range
-    sensor_stats = get_collection_info(collection)
-
-    # Check if there is new sensor data compared to the stored dataset
-    if check_product_update(config.PRODUCT_S2_LEVEL_1C['product_name'], sensor_stats[1]) is True:
-        # Get the list of images
-        image_list = collection.toList(collection.size())
-        image_list_size = image_list.size().getInfo()
-        print("{} new image(s) for: {} to {}".format(
-            image_list_size, sensor_stats[1], current_date_str))
-
-        # Generate the mosaic name and sensing date by geeting EE asset ids from the first image
-        mosaic_id = ee.Image(image_list.get(0))
-        mosaic_id = mosaic_id.id().getInfo()
-        mosaic_sensing_timestamp = mosaic_id.split('_')[2]
-
-        # Export the different bands
-        for i in range(num_images):
-            # Generate the mosaic name and sensing date by geeting EE asset ids from the first image
-            mosaic_id = ee.Image(image_list.get(i))
-            mosaic_id = mosaic_id.id().getInfo()
-            mosaic_sensing_timestamp = mosaic_id.split('_')[2]
-
-            clipped_image = ee.Image(collection.toList(num_images).get(i))
-            # step0 No need to mosaic an clip since with step0 it is already clipped
-
-            # Create a mosaic of the images for the specified date and time
-            # mosaic = collection.mosaic()
-
-            # Clip Image to ROI
-            # might add .unmask(config.NODATA)
-            # clipped_image = mosaic.clip(roi) # No need to clip since with step0 it is already clipped
-
-            # Intersect ROI and clipped mosaic
-            # Create an empty list to hold the footprints
-            # footprints = ee.List([])
-
-            # Function to extract footprint from each image and add to the list
-            # def add_footprint(image, lst):
-            #     footprint = image.geometry()
-            #     return ee.List(lst).add(footprint)
-
-            # Map the add_footprint function over the collection to create a list of footprints
-            # footprints_list = collection.iterate(add_footprint, footprints)
-
-            # Reduce the list of footprints into a single geometry using reduce
-            # combined_swath_geometry = ee.Geometry.MultiPolygon(footprints_list)
-
-            # Asset Geometry
-            # combined_swath_geometry = ee.Geometry.MultiPolygon(
-            #     image.geometry())
-
-        prepare_export(clipped_image_bounding_box, mosaic_sensing_timestamp, multiband_export_name,
-                       config.PRODUCT_S2_LEVEL_1C['product_name'], config.PRODUCT_S2_LEVEL_1C['spatial_scale_export'],
-                       multiband_export, sensor_stats, current_date_str)
-
-        # Export QA60 band as a separate GeoTIFF with '_QA60'
-        masks_export = clipped_image.select(
-            ['terrainShadowMask', 'cloudAndCloudShadowMask'])
-        masks_export_name = mosaic_id.replace('_bands-10m', '_masks-10m')
-        prepare_export(clipped_image_bounding_box, mosaic_sensing_timestamp, masks_export_name,
-                       config.PRODUCT_S2_LEVEL_1C['product_name'],
-                       config.PRODUCT_S2_LEVEL_1C['spatial_scale_export_mask'], masks_export,
-                       sensor_stats, current_date_str)
-
-
-def process_NDVI_MAX_TOA(roi):
-    """
-    Process the NDVI MAX product for TOA.
-
-    Returns:
-        None
-    """
-    product_name = config.PRODUCT_NDVI_MAX_TOA['product_name']
-    print("********* processing {} *********".format(product_name))
-
-    # Filter the sensor collection based on date and region
-    start_date = ee.Date(
-        current_date).advance(-int(config.PRODUCT_NDVI_MAX_TOA['temporal_coverage'])+1, 'day')
-
-    end_date = ee.Date(current_date).advance(1, 'day')
-
-    sensor = (
-        ee.ImageCollection(config.PRODUCT_NDVI_MAX_TOA['step0_collection'])
-        .filterDate(start_date, end_date)
-        .filterBounds(roi)
-    )
-
-    # Get information about the available sensor data for the range
-    sensor_stats = get_collection_info(sensor)
-
-    # Check if there is new sensor data compared to the stored dataset
-    if check_product_update(config.PRODUCT_NDVI_MAX_TOA['product_name'], sensor_stats[1]) is True:
-        print("new imagery from: "+sensor_stats[1])
-
-        # Create NDVI and NDVI max
-        sensor = sensor.map(lambda image: addINDEX(
-            image, bands=config.PRODUCT_NDVI_MAX_TOA['band_names'][0], index_name="NDVI"))
-
-        mosaic = sensor.qualityMosaic("NDVI")
-        ndvi_max = mosaic.select("NDVI")
-
-        # Multiply by 100 to move the decimal point two places back to the left and get rounded values,
-        # then round then cast to get int16, Int8 is not a solution since COGTiff is not supported
-        ndvi_max_int = ndvi_max.multiply(100).round().toInt16()
-
-        # Mask outside
-        ndvi_max_int = maskOutside(ndvi_max_int, roi).unmask(config.NODATA)
-
-        # Define item Name
-        timestamp = datetime.datetime.strptime(current_date_str, '%Y-%m-%d')
-        timestamp = timestamp.strftime('%Y%m%dT235959')
-
-        # Generate the filename
-        filename = config.PRODUCT_NDVI_MAX_TOA['prefix'] + \
-            '_' + timestamp + '_10m.tif'
-        print(filename)
-
-        # Start the export
-        prepare_export(roi, timestamp, filename, config.PRODUCT_NDVI_MAX['product_name'],
-                       config.PRODUCT_NDVI_MAX['spatial_scale_export'], ndvi_max_int,
-                       sensor_stats, current_date_str)
-
-
 def process_PRODUCT_V1(roi):
     """
     Process swissEO VHI: Karte des Vegetationszustandes .ch.swisstopo.swisseo_vhi_v100
@@ -994,6 +910,11 @@ def process_PRODUCT_V1(roi):
     # Get information about the available sensor data for the range
     sensor_stats = get_collection_info(sensor)
 
+    # Check if there are any new imagery
+    if sensor_stats[2] == 0:
+        print("no new imagery")
+        return 0
+
     # Check if there is new sensor data compared to the stored dataset
     if check_product_update(config.PRODUCT_V1['product_name'], sensor_stats[1]) is True:
         print("new imagery from: "+sensor_stats[1])
@@ -1032,7 +953,7 @@ def process_PRODUCT_V1(roi):
         # set the properties
         ndvi_max_int = ndvi_max_int.set('system:time_start', time_start) \
             .set('system:time_end', time_end) \
-            .set('collection', collection_ready)\
+            .set('collection', config.PRODUCT_V1['step0_collection'])\
             .set('index_list', index_list) \
             .set('scene_count', scene_count) \
             .set('GEE_api_version', ee_version)
@@ -1063,23 +984,22 @@ def process_S2_LEVEL_1C(roi):
         .filterDate(start_date, end_date)
         .filterBounds(roi)
     )
+    # Get information about the available sensor data for the range
+    sensor_stats = get_collection_info(collection)
+
     # Get the number of images found in the collection
-    num_images = collection.size().getInfo()
+    num_images = sensor_stats[2]
     # Check if there are any new imagery
     if num_images == 0:
         print("no new imagery")
         return 0
 
-    # Get information about the available sensor data for the range
-    sensor_stats = get_collection_info(collection)
-
     # Check if there is new sensor data compared to the stored dataset
     if check_product_update(config.PRODUCT_S2_LEVEL_1C['product_name'], sensor_stats[1]) is True:
         # Get the list of images
-        image_list = collection.toList(collection.size())
-        image_list_size = image_list.size().getInfo()
+        image_list = collection.toList(num_images)
         print("{} new image(s) for: {} to {}".format(
-            image_list_size, sensor_stats[1], current_date_str))
+            num_images, sensor_stats[1], current_date_str))
 
         # Generate the mosaic name and sensing date by geeting EE asset ids from the first image
         mosaic_id = ee.Image(image_list.get(0))
@@ -1158,6 +1078,11 @@ def process_NDVI_MAX_TOA(roi):
     # Get information about the available sensor data for the range
     sensor_stats = get_collection_info(sensor)
 
+    # Check if there are any new imagery
+    if sensor_stats[2] == 0:
+        print("no new imagery")
+        return 0
+
     # Check if there is new sensor data compared to the stored dataset
     if check_product_update(config.PRODUCT_NDVI_MAX_TOA['product_name'], sensor_stats[1]) is True:
         print("new imagery from: "+sensor_stats[1])
@@ -1191,6 +1116,95 @@ def process_NDVI_MAX_TOA(roi):
                        sensor_stats, current_date_str)
 
 
+def process_product(product_key):
+    """
+    Process a single product with the processing function and ROI registered for it.
+
+    Args:
+        product_key (str): Name of the product in the configuration, e.g. 'PRODUCT_NDVI_MAX'.
+
+    Returns:
+        The result of the processing function.
+    """
+    products_by_key, _ = get_product_registry()
+    product = products_by_key[product_key]
+    print('Launching product {}'.format(product_key))
+    return product['handler'](product['roi']())
+
+
+def process_products(product_keys):
+    """
+    Process products concurrently.
+
+    The products are independent of each other and mostly wait for GEE, so they are run in a
+    thread pool bounded by config.PRODUCT_MAX_WORKERS. A failing product is reported and does
+    not stop the other products.
+
+    Args:
+        product_keys (list): Names of the products in the configuration.
+
+    Returns:
+        dict: The result of each product, or the exception raised while processing it.
+    """
+    # Check the configuration before launching anything
+    products_by_key, _ = get_product_registry()
+    for product_key in product_keys:
+        product = products_by_key.get(product_key)
+        if product is None or product['handler'] is None:
+            raise BrokenPipeError('Inconsitent configuration')
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=config.PRODUCT_MAX_WORKERS) as executor:
+        futures = {executor.submit(process_product, product_key): product_key
+                   for product_key in product_keys}
+        for future in as_completed(futures):
+            product_key = futures[future]
+            try:
+                results[product_key] = future.result()
+            except Exception as e:
+                print(f"Product {product_key} FAILED: {e}")
+                traceback.print_exc()
+                results[product_key] = e
+
+    return results
+
+
+def get_roi_rectangle():
+    """
+    Returns the ROI rectangle defined in the configuration.
+
+    Returns:
+    ee.Geometry: ROI rectangle.
+    """
+    return ee.Geometry.Rectangle(config.ROI_RECTANGLE)
+
+
+def get_roi_border():
+    """
+    Returns the Swiss border buffered by the distance defined in the configuration.
+
+    Returns:
+    ee.Geometry: Buffered Swiss border.
+    """
+    border = ee.FeatureCollection(
+        "USDOS/LSIB_SIMPLE/2017").filter(ee.Filter.eq("country_co", "SZ"))
+    return border.geometry().buffer(config.ROI_BORDER_BUFFER)
+
+
+# Processing function and ROI function of each product, keyed by the product's name in the configuration.
+# ROI is only taking effect when testing for PRODUCT_S2_LEVEL_2A. On prod we will use the clipping as defined in step0_processor_s2_sr
+# Other test ROIs:
+# roi = ee.Geometry.Rectangle( [ 7.075402, 46.107098, 7.100894, 46.123639])
+# roi = ee.Geometry.Rectangle([9.49541, 47.22246, 9.55165, 47.26374,])  # Lichtenstein
+PRODUCT_HANDLERS = {
+    'PRODUCT_NDVI_MAX': (process_NDVI_MAX, get_roi_rectangle),
+    'PRODUCT_S2_LEVEL_2A': (process_S2_LEVEL_2A, get_roi_rectangle),
+    'PRODUCT_V1': (process_PRODUCT_V1, get_roi_rectangle),
+    'PRODUCT_NDVI_MAX_TOA': (process_NDVI_MAX_TOA, get_roi_rectangle),
+    'PRODUCT_S2_LEVEL_1C': (process_S2_LEVEL_1C, get_roi_border),
+}
+
+
 if __name__ == "__main__":
     # Test if we are on Local DEV Run or if we are on PROD
     determine_run_type()
@@ -1211,7 +1225,9 @@ if __name__ == "__main__":
 
     current_date = ee.Date(current_date_str)
 
-    roi = ee.Geometry.Rectangle(config.ROI_RECTANGLE)
+    # Build the product registry once for the run
+    products_by_key, products_by_name = get_product_registry()
+
     step0_product_dict = get_step0_dict()
     print(step0_product_dict)
 
@@ -1219,43 +1235,19 @@ if __name__ == "__main__":
         step0_product_dict, current_date_str)
     print(collections_ready_for_processors)
 
+    # Collect the products of all ready collections
+    products_to_be_processed = []
     for collection_ready in collections_ready_for_processors:
         print('Collection ready: {}'.format(collection_ready))
-        for product_to_be_processed in step0_product_dict[collection_ready][0]:
-            print('Launching product {}'.format(product_to_be_processed))
-            if product_to_be_processed == 'PRODUCT_NDVI_MAX':
-                roi = ee.Geometry.Rectangle(config.ROI_RECTANGLE)
-                result = process_NDVI_MAX(roi)
-
-            elif product_to_be_processed == 'PRODUCT_S2_LEVEL_2A':
-                # ROI is only taking effect when testing. On prod we will use the clipping as defined in step0_processor_s2_sr
-                # border = ee.FeatureCollection(
-                #     "USDOS/LSIB_SIMPLE/2017").filter(ee.Filter.eq("country_co", "SZ"))
-                # roi = border.geometry().buffer(config.ROI_BORDER_BUFFER)
-                # roi = ee.Geometry.Rectangle( [ 7.075402, 46.107098, 7.100894, 46.123639])
-                # roi = ee.Geometry.Rectangle(
-                #     [9.49541, 47.22246, 9.55165, 47.26374,])  # Lichtenstein
-                result = process_S2_LEVEL_2A(roi)
-
-            elif product_to_be_processed == 'PRODUCT_V1':
-                roi = ee.Geometry.Rectangle(config.ROI_RECTANGLE)
-                # roi = ee.Geometry.Rectangle(
-                #     [9.49541, 47.22246, 9.55165, 47.26374,])  # Lichtenstein
-                result = process_PRODUCT_V1(roi)
-
-            elif product_to_be_processed == 'PRODUCT_NDVI_MAX_TOA':
-                roi = ee.Geometry.Rectangle(config.ROI_RECTANGLE)
-                result = process_NDVI_MAX_TOA(roi)
-
-            elif product_to_be_processed == 'PRODUCT_S2_LEVEL_1C':
-                border = ee.FeatureCollection(
-                    "USDOS/LSIB_SIMPLE/2017").filter(ee.Filter.eq("country_co", "SZ"))
-                roi = border.geometry().buffer(config.ROI_BORDER_BUFFER)
-                # roi = ee.Geometry.Rectangle( [ 7.075402, 46.107098, 7.100894, 46.123639])
-                result = process_S2_LEVEL_1C(roi)
-            else:
-                raise BrokenPipeError('Inconsitent configuration')
-
-            print("Result:", result)
+        products_to_be_processed.extend(
+            step0_product_dict[collection_ready][0])
+
+    # Process the products concurrently
+    results = process_products(products_to_be_processed)
+    for product_to_be_processed, result in results.items():
+        print("Result {}:".format(product_to_be_processed), result)
+
+    # Start all exports of the run
+    submit_exports()
 
 print("Processing done!")
@@ -2,7 +2,6 @@
 from pydrive.auth import GoogleAuth
 from pydrive.drive import GoogleDrive
 from oauth2client.service_account import ServiceAccountCredentials
-import csv
 import json
 import os
 import ee
@@ -12,13 +11,31 @@ import subprocess
 import glob
 import platform
 import re
-from satromo_publish_stac_fsdi import publish_to_stac
+import queue
+import shutil
+import tempfile
+import threading
+import traceback
+import contextlib
+import rasterio
+import rasterio.shutil
+from rasterio.merge import merge
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from satromo_publish_stac_fsdi import publish_to_stac, publish_assets_to_stac
 import main_functions
+import state_store
 
 
 # Set the CPL_DEBUG environment variable to enable verbose output
 # os.environ["CPL_DEBUG"] = "ON"
 
+# Status of the GEE tasks of the run by task ID, see fetch_task_statuses()
+task_statuses = {}
+
+# Files on Google Drive by filename, listed once per run, see get_drive_inventory()
+drive_inventory = None
+
 
 def determine_run_type():
     """
@@ -200,15 +217,34 @@ def move_files_with_rclone(source, destination, move=True):
         print("SUCCESS: copied " + source + " to " + destination)
 
 
-def merge_files_with_gdal_warp(source):
+def get_merge_windows(width, height, window_size):
+    """
+    Splits a raster into square windows.
+
+    Parameters:
+    width (int): Width of the raster in pixels.
+    height (int): Height of the raster in pixels.
+    window_size (int): Size of the windows in pixels.
+
+    Returns:
+    list: The windows (rasterio.windows.Window) covering the raster, row by row.
+    """
+    return [Window(col_off, row_off, min(window_size, width - col_off), min(window_size, height - row_off))
+            for row_off in range(0, height, window_size)
+            for col_off in range(0, width, window_size)]
+
+
+def merge_files(source):
     """
-    Merge with GDAL 
+    Merge the tiles of an export into a COG in-process with rasterio.
+    The mosaic is built window by window (config.MERGE_WINDOW_SIZE), pixels outside the cutline config.BUFFER are set
+    to config.NODATA. The COG is written with config.MERGE_BLOCK_SIZE and config.MERGE_NUM_THREADS.
 
     Parameters:
     source (str): Source filename .
 
     Returns:
-    None
+    str: Filename of the merged COG.
     """
 
     # check local disk disk space
@@ -225,77 +261,175 @@ def merge_files_with_gdal_warp(source):
     file_list = sorted(glob.glob(os.path.join(
         GDRIVE_MOUNT, source+"*.tif")))
 
-    # under Windows Replace double backslashes with single backslashes in the file list
-    if os_name == "Windows":
-        file_list = [filename.replace('\\\\', '\\') for filename in file_list]
-
-    # Write the file names to _list.txt
-    with open(source+"_list.txt", "w") as file:
-        file.writelines([f"{filename}\n" for filename in file_list])
-
-    # run gdal vrt
-    command = ["gdalbuildvrt",
-               "-input_file_list", source+"_list.txt", source+".vrt",
-               "--config", "GDAL_CACHEMAX", "9999",
-               "--config", "GDAL_NUM_THREADS", "ALL_CPUS",
-               "--config", "CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE", "YES",
-               # "-vrtnodata", str(config.NODATA),
-               # "-srcnodata", str(config.NODATA),
-               ]
-    # print(command)
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    print(result)
-
-    # run gdal translate
-    command = ["gdalwarp",
-               # rename to source+"_merged.tif" when doing reprojection afterwards
-               source+".vrt", source+".tif",
-               "-of", "COG",
-               "-cutline", config.BUFFER,
-               "-dstnodata",  str(config.NODATA),
-               # "-srcnodata", str(config.NODATA),
-               # "-co", "NUM_THREADS=ALL_CPUS",
-               "-co", "BIGTIFF=YES",
-               # "--config", "GDAL_CACHEMAX", "9999",
-               # "--config", "GDAL_NUM_THREADS", "ALL_CPUS",
-               "--config", "CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE", "YES",
-               # otherwise use compress=LZW
-               # https://kokoalberti.com/articles/geotiff-compression-optimization-guide/ and https://digital-geography.com/geotiff-compression-comparison/
-               "-co", "COMPRESS=DEFLATE",
-               "-co", "PREDICTOR=2",
-               # "-r", "near", #enforce nearest with cutline
-               ]
-    # print(command)
-    result = subprocess.run(command, check=True,
-                            capture_output=True, text=True)
-    print(result)
-
-    # For Debugging uncomment  below
-    # print("Standard Output:")
-    # print(result.stdout)
-    # print("Standard Error:")
-    # print(result.stderr)
+    with contextlib.ExitStack() as stack:
+        tiles = [stack.enter_context(rasterio.open(filename))
+                 for filename in file_list]
+        first_tile = tiles[0]
+
+        # Extent of the mosaic, on the grid of the first tile
+        xres, yres = first_tile.res
+        left = min(tile.bounds.left for tile in tiles)
+        bottom = min(tile.bounds.bottom for tile in tiles)
+        right = max(tile.bounds.right for tile in tiles)
+        top = max(tile.bounds.top for tile in tiles)
+        width = int(round((right - left) / xres))
+        height = int(round((top - bottom) / yres))
+        transform = from_origin(left, top, xres, yres)
+
+        # The mosaic is written window by window to a tiled GeoTIFF, then copied to a COG
+        # (the COG driver can only write a complete dataset)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mosaic_file = os.path.join(temp_dir, source+".tif")
+            with rasterio.open(mosaic_file, "w", driver="GTiff", width=width, height=height,
+                               count=first_tile.count, dtype=first_tile.dtypes[0], crs=first_tile.crs,
+                               transform=transform, nodata=config.NODATA, tiled=True,
+                               blockxsize=config.MERGE_BLOCK_SIZE, blockysize=config.MERGE_BLOCK_SIZE,
+                               compress="DEFLATE", zlevel=1, predictor=2, bigtiff="YES",
+                               num_threads=config.MERGE_NUM_THREADS) as mosaic:
+                for band, description in enumerate(first_tile.descriptions, start=1):
+                    if description:
+                        mosaic.set_band_description(band, description)
+
+                for window in get_merge_windows(width, height, config.MERGE_WINDOW_SIZE):
+                    window_transform = mosaic.window_transform(window)
+                    # Like in a VRT, the last tile wins where tiles overlap
+                    data, _ = merge(tiles, bounds=rasterio.windows.bounds(window, transform),
+                                    res=(xres, yres), nodata=config.NODATA, method="last")
+                    data = data[:, :window.height, :window.width]
+
+                    # Apply the cutline
+                    cutline_mask = main_functions.get_cutline_mask(
+                        first_tile.crs, window_transform, (window.height, window.width))
+                    data[:, ~cutline_mask] = config.NODATA
+
+                    mosaic.write(data, window=window)
+
+            # otherwise use compress=LZW
+            # https://kokoalberti.com/articles/geotiff-compression-optimization-guide/ and https://digital-geography.com/geotiff-compression-comparison/
+            rasterio.shutil.copy(mosaic_file, source+".tif", driver="COG",
+                                 COMPRESS="DEFLATE", PREDICTOR="2", BIGTIFF="YES",
+                                 BLOCKSIZE=str(config.MERGE_BLOCK_SIZE),
+                                 NUM_THREADS=str(config.MERGE_NUM_THREADS))
 
     print("SUCCESS: merged " + source+".tif")
     return (source+".tif")
 
 
-def extract_value_from_csv(filename, search_string, search_col, col_result):
-    try:
-        with open(filename, "r") as file:
-            reader = csv.DictReader(file)
+def get_number_of_tiles(filename):
+    """
+    Get the number of tiles an export has been split into by the processor.
+
+    Parameters:
+    filename (str): Filename of the export without the tile suffix.
 
-            for row in reader:
-                if row[search_col] == search_string:
-                    return row[col_result]
+    Returns:
+    int: Number of tiles recorded in the metadata of the export, 4 for exports made before the
+    number was recorded, None if there is no metadata (the export is then not ready).
+    """
+    metadata_file = os.path.join(
+        config.PROCESSING_DIR, filename + "_metadata.json")
+    if not os.path.exists(metadata_file):
+        return None
+    with open(metadata_file, 'r') as f:
+        metadata = json.load(f)
+    return int(metadata['SWISSTOPO'].get('NUMBEROFTILES', 4))
 
-            print(
-                f"Entry not found for '{search_string}' in column '{search_col}'")
-    except FileNotFoundError:
-        print("File not found.")
 
-    return None
+def fetch_task_statuses(task_ids):
+    """
+    Fetches the status of the given GEE tasks at once: the operations of the project are listed once, indexed by
+    task ID and converted to task statuses locally. Tasks missing from the listing get the state 'UNKNOWN'.
+    The statuses are kept for the run, see get_task_status().
+
+    Args:
+        task_ids (list): The IDs of the tasks.
+
+    Returns:
+        dict: The task status, as returned by ee.data.getTaskStatus, by task ID.
+    """
+    global task_statuses
+
+    operations = {os.path.basename(operation['name']): operation
+                  for operation in ee.data.listOperations()}
+
+    task_statuses = {}
+    for task_id in set(task_ids):
+        if task_id in operations:
+            task_statuses[task_id] = ee._cloud_api_utils.convert_operation_to_task(
+                operations[task_id])
+        else:
+            task_statuses[task_id] = {'id': task_id, 'state': 'UNKNOWN'}
+
+    return task_statuses
+
+
+def get_ready_filenames():
+    """
+    Returns the exports which are ready to be published: all their tiles are registered in the running tasks,
+    as many as recorded in their metadata (see get_number_of_tiles()), and completed.
+    The status of all running tasks is fetched at once, see fetch_task_statuses().
+
+    Returns:
+    list: Filenames of the exports without the tile suffix, ready to be published.
+    """
+    # Get the unique filename and the task ID of each of its tiles
+    tiles_per_filename = {}
+
+    for task_id, full_filename in state_store.get_running_tasks():
+        # Take the part before "quadrant"
+        filename = full_filename.split('quadrant')[0].strip()
+        tiles_per_filename.setdefault(filename, {}).setdefault(
+            full_filename.strip(), task_id)
+
+    # Get the status of all running tasks at once
+    fetch_task_statuses([task_id for tiles in tiles_per_filename.values()
+                         for task_id in tiles.values()])
+
+    # Check  if each tile is complete then process
+    # Iterate over unique filenames
+    ready_filenames = []
+    for filename, tiles in tiles_per_filename.items():
+
+        # Keep track of completion status, all tiles of the export have to be registered,
+        # without metadata the number of tiles is unknown and the export is not ready
+        number_of_tiles = get_number_of_tiles(filename)
+        all_completed = number_of_tiles is not None and len(
+            tiles) >= number_of_tiles
+        if not all_completed:
+            print(f"{filename} - {len(tiles)} of {number_of_tiles} tiles registered")
+
+        for full_filename, task_id in tiles.items():
+            # Check task status
+            task_status = task_statuses[task_id]
+
+            if task_status["state"] != "COMPLETED":
+                # Task is not completed
+                all_completed = False
+                print(f"{full_filename} - {task_status['state']}")
+
+        # Check overall completion status
+        if all_completed:
+            print(filename+" is ready to process")
+            ready_filenames.append(filename)
+        else:
+            print(filename+" is NOT ready to process")
+
+    return ready_filenames
+
+
+def get_task_status(task_id):
+    """
+    Returns the status of a GEE task, from the statuses fetched for the run if available.
+
+    Args:
+        task_id (str): The ID of the task.
+
+    Returns:
+        dict: The task status, as returned by ee.data.getTaskStatus.
+    """
+    if task_id in task_statuses:
+        return task_statuses[task_id]
+    return ee.data.getTaskStatus(task_id)[0]
 
 
 def write_update_metadata(filename, filemeta):
@@ -338,8 +472,30 @@ def write_update_metadata(filename, filemeta):
             json.dump(metadata, json_file)
 
         # upload consolidated META JSON file to FSDI STAC
-        publish_to_stac(
-            file_path, metadata[band_name]['PROPERTIES']['ITEM'], metadata[band_name]['PROPERTIES']['PRODUCT'], metadata[band_name]['PROPERTIES']['GEOCATID'])
+        if not publish_to_stac(
+                file_path, metadata[band_name]['PROPERTIES']['ITEM'], metadata[band_name]['PROPERTIES']['PRODUCT'], metadata[band_name]['PROPERTIES']['GEOCATID']):
+            print(f"{file_path} upload to FSDI STAC FAILED")
+
+
+def get_drive_inventory():
+    """
+    Lists the files on Google Drive once per run, page by page and with the required fields only.
+    The files are indexed by their filename without the tile suffix, i.e. the part of the title before "quadrant".
+
+    Returns:
+        dict: The list of files (pydrive GoogleDriveFile) on Google Drive by filename.
+    """
+    global drive_inventory
+
+    if drive_inventory is None:
+        drive_inventory = {}
+        for file_page in drive.ListFile({"q": "trashed=false", "maxResults": 1000,
+                                         "fields": "nextPageToken,items(id,title)"}):
+            for file in file_page:
+                drive_inventory.setdefault(
+                    file['title'].split('quadrant')[0], []).append(file)
+
+    return drive_inventory
 
 
 def clean_up_gdrive(filename):
@@ -356,10 +512,9 @@ def clean_up_gdrive(filename):
     # file_list = drive.ListFile({
     #     "q": "title contains '"+filename+"' and trashed=false"
     # }).GetList()
-    # The  approach above does not work if there are a lot of files
-
-    filtered_files = drive.ListFile({"q": "trashed=false"}).GetList()
-    file_list = [file for file in filtered_files if filename in file['title']]
+    # The  approach above does not work if there are a lot of files, the Drive is listed once per run instead
+    inventory = get_drive_inventory()
+    file_list = list(inventory.get(filename, []))
 
     # Check if the file is found
     if len(file_list) > 0:
@@ -369,11 +524,11 @@ def clean_up_gdrive(filename):
 
             # Get the current Task id
             file_on_drive = file['title']
-            file_task_id = extract_value_from_csv(
-                config.GEE_RUNNING_TASKS, file_on_drive.replace(".tif", ""), "Filename", "Task ID")
+            file_task_id = state_store.get_running_task_id(
+                file_on_drive.replace(".tif", ""))
 
             # Check task status
-            file_task_status = ee.data.getTaskStatus(file_task_id)[0]
+            file_task_status = get_task_status(file_task_id)
 
             # Get the product and item
             file_product, file_item = extract_product_and_item(
@@ -381,13 +536,14 @@ def clean_up_gdrive(filename):
 
             # Delete the file
             file.Delete()
+            inventory[filename].remove(file)
             print(f"File {file['title']} DELETED on Google Drive.")
 
             # Add DATA GEE PROCESSING info to stats
-            write_file(file_task_status, config.GEE_COMPLETED_TASKS)
+            state_store.add_completed_task(file_task_status)
 
-            # Remove the line from the RUNNING tasks file
-            delete_line_in_file(config.GEE_RUNNING_TASKS, file_task_id)
+            # Remove the task from the RUNNING tasks
+            state_store.delete_running_task(file_task_id)
 
         # Obsolete from here
         # # Add DATA GEE PROCESSING info to Metadata of item,
@@ -457,74 +613,14 @@ def clean_up_gdrive(filename):
         #     for file_to_move in files_matching_pattern:
         #         move_files_with_rclone(file_to_move, destination_dir)
 
-        # Update Status in RUNNING tasks file
-        replace_running_with_complete(
-            config.LAST_PRODUCT_UPDATES, file_product)
-
-        # Clean up GDAL temporary files
-
-        # VRT file, Pattern for .vrt files
-        vrt_pattern = f"*{existing_data['SWISSTOPO']['ITEM']}*.vrt"
-        vrt_files = glob.glob(vrt_pattern)
-        [os.remove(file_path)
-         for file_path in vrt_files if os.path.exists(file_path)]
-
-        # Pattern for _list.txt files
-        list_txt_pattern = f"*{existing_data['SWISSTOPO']['ITEM']}*_list.txt"
-        list_files = glob.glob(list_txt_pattern)
-        [os.remove(file_path)
-         for file_path in list_files if os.path.exists(file_path)]
+        # Update Status of the product
+        state_store.set_product_status(file_product, 'complete')
     else:
         # No files found
         print("No files found in GDRIVE to delete and move for "+filename)
     return
 
 
-def write_file(input_dict, output_file):
-    """
-    Write a dictionary to a CSV file. If the file exists, the data is appended
-    to it. If the file does not exist, a new file is created with a header.
-
-    Parameters:
-    input_dict (dict): Dictionary to be written to file.
-    output_file (str): Path of the output file.
-
-    Returns:
-    None
-    """
-    append_or_write = "a" if os.path.isfile(output_file) else "w"
-    with open(output_file, append_or_write, encoding="utf-8", newline='') as f:
-        dict_writer = csv.DictWriter(f, fieldnames=list(input_dict.keys()),
-                                     delimiter=",", quotechar='"',
-                                     lineterminator="\n")
-        if append_or_write == "w":
-            dict_writer.writeheader()
-        dict_writer.writerow(input_dict)
-    return
-
-
-def delete_line_in_file(filepath, stringtoremove):
-    """
-    Delete lines containing a specific string from a file.
-
-    Parameters:
-    filepath (str): Path of the file to modify.
-    stringtoremove (str): String to search for and remove from the file.
-
-    Returns:
-    None
-    """
-    with open(filepath, "r+") as file:
-        lines = file.readlines()
-        file.seek(0)
-        file.truncate()
-        for line in lines:
-            if stringtoremove not in line.strip() and line.strip():
-                file.write(line)
-            elif not line.strip():
-                file.write("\n")
-
-
 # def write_file_meta(input_dict, output_file):
 #     """
 #     Read the existing CSV file, append the input dictionary, and export it as a new CSV file.
@@ -571,6 +667,128 @@ def delete_line_in_file(filepath, stringtoremove):
 #     return existing_data
 
 
+def prepare_publication(filename):
+    """
+    First stage of the publication: merges the tiles of a file and creates its thumbnail.
+
+    Parameters:
+    filename (str): Filename of the export without the tile suffix.
+
+    Returns:
+    tuple: The merged file, its metadata and its thumbnail (False if there is none).
+    """
+    # merge files
+    file_merged = merge_files(filename)
+
+    # read metadata from json
+    with open(os.path.join(
+            config.PROCESSING_DIR, file_merged.replace(".tif", "_metadata.json")), 'r') as f:
+        metadata = json.load(f)
+
+    # Create thumbnail
+    thumbnail = main_functions.create_thumbnail(
+        file_merged, metadata['SWISSTOPO']['PRODUCT'])
+
+    # Keep the thumbnail in its own directory, the thumbnail of the next file is created under the same name
+    if thumbnail is not False:
+        thumbnail = shutil.move(thumbnail, os.path.join(
+            tempfile.mkdtemp(prefix="thumbnail_"), os.path.basename(thumbnail)))
+
+    return file_merged, metadata, thumbnail
+
+
+def publish_file(filename, file_merged, metadata, thumbnail):
+    """
+    Second stage of the publication: uploads the merged file and its thumbnail to FSDI STAC, moves them to S3 and
+    cleans up Google Drive. If the upload fails, a RuntimeError is raised before the move and the clean up.
+
+    Parameters:
+    filename (str): Filename of the export without the tile suffix.
+    file_merged (str): The merged file.
+    metadata (dict): The metadata of the merged file.
+    thumbnail (str): The thumbnail, False if there is none.
+
+    Returns:
+    None
+    """
+    # upload file and thumbnail to FSDI STAC, on failure the file stays on Google Drive and RUNNING,
+    # the upload is resumed by the next run
+    assets = [file_merged] if thumbnail is False else [
+        file_merged, thumbnail]
+    if not publish_assets_to_stac(
+            assets, metadata['SWISSTOPO']['ITEM'], metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['GEOCATID']):
+        raise RuntimeError(f"{filename} upload to FSDI STAC FAILED")
+
+    # move file to INT STAC : in case reproejction is done here: move file_reprojected
+    move_files_with_rclone(
+        file_merged, os.path.join(S3_DESTINATION, metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['ITEM']))
+
+    # Move thumbnail
+    if thumbnail is not False:
+        move_files_with_rclone(
+            thumbnail, os.path.join(S3_DESTINATION, metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['ITEM']))
+        shutil.rmtree(os.path.dirname(thumbnail), ignore_errors=True)
+
+    # clean up GDrive and local drive
+    clean_up_gdrive(filename)
+
+
+def run_publication_pipeline(filenames):
+    """
+    Publishes files in two stages connected by a queue: the merge and thumbnail (GDAL) of a file run in the
+    calling thread while the upload, rclone move and clean up of the previous files run in a publisher thread.
+    A file holds its place from the start of its merge until its clean up, at most config.PUBLISH_QUEUE_SIZE + 1
+    merged files are on disk: the file being published and the files being merged or waiting (plus the temporary
+    mosaic of the file being merged, see merge_files()).
+    A file which fails in one of the stages is reported, its local files are removed and it is skipped.
+
+    Parameters:
+    filenames (list): Filenames of the exports without the tile suffix, ready to be published.
+
+    Returns:
+    None
+    """
+    merged_files = threading.BoundedSemaphore(config.PUBLISH_QUEUE_SIZE + 1)
+    publication_queue = queue.Queue()
+
+    def publish_worker():
+        while True:
+            publication = publication_queue.get()
+            if publication is None:
+                return
+            filename, file_merged, metadata, thumbnail = publication
+            try:
+                publish_file(*publication)
+            except Exception:
+                print(filename+" publication FAILED")
+                traceback.print_exc()
+                # Remove what was not moved to S3, the file is published again on the next run
+                if os.path.exists(file_merged):
+                    os.remove(file_merged)
+                if thumbnail is not False:
+                    shutil.rmtree(os.path.dirname(thumbnail), ignore_errors=True)
+            finally:
+                merged_files.release()
+
+    publisher = threading.Thread(target=publish_worker)
+    publisher.start()
+    try:
+        for filename in filenames:
+            # Wait until the publisher has cleaned up a file if the limit of merged files is reached
+            merged_files.acquire()
+            try:
+                publication = prepare_publication(filename)
+            except Exception:
+                merged_files.release()
+                print(filename+" merge FAILED")
+                traceback.print_exc()
+                continue
+            publication_queue.put((filename,) + publication)
+    finally:
+        publication_queue.put(None)
+        publisher.join()
+
+
 def extract_product_and_item(task_description):
     """
     Extract the product and item information from a task description.
@@ -594,28 +812,6 @@ def extract_product_and_item(task_description):
     return product, item
 
 
-def replace_running_with_complete(input_file, item):
-    """
-    Replace 'RUNNING' with 'complete' in the specific item line of an input file.
-
-    Parameters:
-    input_file (str): Path to the input file.
-    item (str): Item to identify the line to be modified.
-
-    Returns:
-    None
-    """
-    output_lines = []
-    with open(input_file, 'r') as f:
-        for line in f:
-            if line.startswith(item):
-                line = line.replace('RUNNING', 'complete')
-            output_lines.append(line)
-
-    with open(input_file, 'w') as f:
-        f.writelines(output_lines)
-
-
 if __name__ == "__main__":
 
     # Test if we are on Local DEV Run or if we are on PROD
@@ -630,101 +826,11 @@ if __name__ == "__main__":
         file.Delete()
         print('GDRIVE TRASH: Deleted file: %s' % file['title'])
 
-    # Read the status file
-    with open(config.GEE_RUNNING_TASKS, "r") as f:
-        lines = f.readlines()
+    # Get the files whose tiles are all completed
+    ready_filenames = get_ready_filenames()
 
-    # Get the unique filename
-    unique_filenames = set()
-
-    for line in lines[1:]:  # Start from the second line
-        _, filename = line.strip().split(',')
-        # Take the part before "quadrant"
-        filename = filename.split('quadrant')[0]
-        unique_filenames.add(filename.strip())
-
-    unique_filenames = list(unique_filenames)
-
-    # Check  if each quandrant is complete then process
-    # Iterate over unique filenames
-    for filename in unique_filenames:
-
-        # Keep track of completion status
-        all_completed = True
-        # You need to change this if we have more than 4 quadrants
-        for quadrant_num in range(1, 5):
-            # Construct the filename with the quadrant
-            full_filename = filename + "quadrant" + str(quadrant_num)
-
-            # Find the corresponding task ID in the lines list
-            task_id = None
-            for line in lines[1:]:
-                if full_filename in line:
-                    task_id = line.strip().split(",")[0]
-                    break
-
-            if task_id:
-                # Check task status
-                task_status = ee.data.getTaskStatus(task_id)[0]
-
-            if task_status["state"] != "COMPLETED":
-                # Task is not completed
-                all_completed = False
-                print(f"{full_filename} - {task_status['state']}")
-
-        # Check overall completion status
-        if all_completed:
-            # if run_type == 2:
-            # local machine run
-            # Download DATA
-            # breakpoint()  # TODO add local processor
-            # download_and_delete_file(filename)
-            # else:
-            print(filename+" is ready to process")
-
-            # Get the product and item
-            # product, item = extract_product_and_item(
-            #    task_status['description'])
-
-            # # Get the metadata
-            # metadata = read_file_meta(os.path.join(
-            #     config.PROCESSING_DIR, filename+".csv"))
-
-            # merge files
-            file_merged = merge_files_with_gdal_warp(filename)
-
-            # Get metdatafile by replacing ".tif" by "_metadata.json"
-            # metadata_file = file_merged.replace(".tif", "_metadata.json")
-
-            # read metadata from json
-            with open(os.path.join(
-                    config.PROCESSING_DIR, file_merged.replace(".tif", "_metadata.json")), 'r') as f:
-                metadata = json.load(f)
-
-            # Create thumbnail
-            thumbnail = main_functions.create_thumbnail(
-                file_merged, metadata['SWISSTOPO']['PRODUCT'])
-
-            # upload file to FSDI STAC
-            publish_to_stac(
-                file_merged, metadata['SWISSTOPO']['ITEM'], metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['GEOCATID'])
-
-            # move file to INT STAC : in case reproejction is done here: move file_reprojected
-            move_files_with_rclone(
-                file_merged, os.path.join(S3_DESTINATION, metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['ITEM']))
-
-            # Upload and move thumbnail
-            if thumbnail is not False:
-                publish_to_stac(
-                    thumbnail, metadata['SWISSTOPO']['ITEM'], metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['GEOCATID'])
-                move_files_with_rclone(
-                    thumbnail, os.path.join(S3_DESTINATION, metadata['SWISSTOPO']['PRODUCT'], metadata['SWISSTOPO']['ITEM']))
-            # clean up GDrive and local drive
-            # os.remove(file_merged)
-            clean_up_gdrive(filename)
-
-        else:
-            print(filename+" is NOT ready to process")
+    # Merge, publish and clean up the ready files, the merge of a file overlaps the publication of the previous one
+    run_publication_pipeline(ready_filenames)
 
     # delete consolidated META file
     [os.remove(file) for file in glob.glob("*_metadata.json")]
@@ -1,7 +1,9 @@
 import os
+import time
 import hashlib
 from base64 import b64encode
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 import multihash
 from hashlib import md5
@@ -9,7 +11,7 @@ import platform
 import json
 import rasterio
 from rasterio.transform import from_bounds
-from datetime import datetime
+from datetime import datetime, timezone
 import pyproj
 import re
 
@@ -20,11 +22,10 @@ This script is used to publish geospatial data to the Swiss Federal Spatial Data
 
 The script handles the following tasks:
 - Determines the run type (development or production) based on the existence of the SECRET on the local machine file.
-- Initializes FSDI authentication.
-- Checks if an item exists in the STAC collection.
+- Initializes FSDI authentication and a pooled HTTP session, once per run.
+- Checks if an item exists in the STAC collection, once per run and item.
 - Creates a new item in the STAC collection if it does not exist.
-- Checks if an asset exists in the STAC item.
-- Creates a new asset in the STAC item if it does not exist.
+- Creates or overwrites the assets in the STAC item.
 - Uploads the asset data to the STAC item.
 
 The script supports multipart upload for large files and single part upload for smaller files.
@@ -43,6 +44,18 @@ References:
 # Multipart upload
 part_size_mb = 100
 attempts = 5
+# Number of parts uploaded in parallel and initial backoff in seconds between attempts (doubled after every failed attempt)
+upload_workers = 4
+retry_backoff = 2
+
+# Single part upload: size of the chunks read to hash the file, larger files are uploaded in multiple parts
+chunk_size_mb = 8
+single_part_max_mb = part_size_mb
+
+# HTTP session shared by all requests of the run, see get_session()
+session = None
+# STAC items known to exist in the run, see publish_assets_to_stac()
+existing_items = set()
 
 # Define the LV95 and WGS84 coordinate systems
 lv95 = pyproj.CRS.from_epsg(2056)  # LV95 EPSG code
@@ -126,7 +139,7 @@ def is_existing(stac_item_path):
     Returns:
         bool: True if the STAC item exists, False otherwise.
     """
-    response = requests.get(
+    response = get_session().get(
         url=stac_item_path,
         # proxies={"https": proxy.guess_proxy()},
         # verify=False,
@@ -217,7 +230,7 @@ def upload_item(item_path, item_payload):
         bool: True if the upload was successful, False otherwise.
     """
     try:
-        response = requests.put(
+        response = get_session().put(
             url=item_path,
             json=item_payload,
             # proxies={"https": proxy.guess_proxy()},
@@ -327,7 +340,7 @@ def create_asset(stac_asset_url, payload):
     Returns:
         bool: True if the creation was successful, False otherwise.
     """
-    response = requests.put(
+    response = get_session().put(
         url=stac_asset_url,
         auth=(user, password),
         # auth=HTTPBasicAuth(user, password),
@@ -342,21 +355,39 @@ def create_asset(stac_asset_url, payload):
         return False
 
 
-def upload_asset_multipart(stac_asset_filename, stac_asset_url, part_size=part_size_mb * 1024 ** 2):
+def get_session():
     """
-    Uploads a STAC asset in multiple parts.
+    Returns the HTTP session of the run, which keeps a pool of persistent connections to the STAC API and for the parallel uploads.
+
+    Args:
+        None
+
+    Returns:
+        requests.Session: The HTTP session.
+    """
+    global session
+
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=upload_workers, pool_maxsize=upload_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
 
-    This function prepares a multipart upload by calculating the SHA256 and MD5 hashes of the parts of the file at `stac_asset_filename`. It then creates a multipart upload, uploads the parts using the presigned URLs, and completes the upload. If any step fails, it returns False. Otherwise, it returns True.
+    return session
+
+
+def get_multipart_checksums(stac_asset_filename, part_size):
+    """
+    Calculates the SHA256 multihash of a file and the MD5 hash of each of its parts, reading the file once.
 
     Args:
         stac_asset_filename (str): The filename of the STAC asset to upload.
-        stac_asset_url (str): The URL where the STAC asset should be uploaded.
-        part_size (int, optional): The size of each part in bytes. Defaults to `part_size_mb * 1024 ** 2`.
+        part_size (int): The size of each part in bytes.
 
     Returns:
-        bool: True if the upload was successful, False otherwise.
+        tuple: The SHA256 multihash of the file and the list of MD5 hashes of the parts, as expected by the STAC API.
     """
-    # 1. Prepare multipart upload
     sha256 = hashlib.sha256()
     md5_parts = []
     with open(stac_asset_filename, "rb") as fd:
@@ -370,51 +401,205 @@ def upload_asset_multipart(stac_asset_filename, stac_asset_url, part_size=part_s
     checksum_multihash = multihash.to_hex_string(
         multihash.encode(sha256.digest(), "sha2-256"))
 
-    # 2. Create a multipart upload
-    response = requests.post(
+    return checksum_multihash, md5_parts
+
+
+def is_valid_upload_url(url):
+    """
+    Checks if a presigned upload URL has not expired yet.
+
+    Args:
+        url (dict): The presigned URL of a part as returned by the STAC API.
+
+    Returns:
+        bool: True if the URL can still be used, False otherwise.
+    """
+    expires = url.get("expires")
+    if expires is None:
+        return True
+    try:
+        return datetime.fromisoformat(expires.replace("Z", "+00:00")) > datetime.now(timezone.utc)
+    except (TypeError, ValueError):
+        return False
+
+
+def get_resumable_upload(stac_asset_url, checksum_multihash, number_parts):
+    """
+    Returns the in-progress upload of an asset which can be resumed, i.e. an upload of the same file with valid presigned URLs.
+    Other in-progress uploads of the asset are aborted, since the STAC API only allows one upload per asset at a time.
+
+    Args:
+        stac_asset_url (str): The URL of the STAC asset.
+        checksum_multihash (str): The SHA256 multihash of the file to upload.
+        number_parts (int): The number of parts of the file to upload.
+
+    Returns:
+        dict: The upload as returned by the STAC API, None if there is no upload to resume.
+    """
+    response = get_session().get(
         url=stac_asset_url + "/uploads",
         auth=(user, password),
-        # auth=HTTPBasicAuth(user, password),
-        # proxies={"https": proxy.guess_proxy()},
-        # verify=False,
-        json={"number_parts": len(
-            md5_parts), "md5_parts": md5_parts, "checksum:multihash": checksum_multihash}
+        params={"status": "in-progress"}
     )
-    if response.status_code // 200 == 1:
-        upload_id = response.json()["upload_id"]
-        urls = response.json()["urls"]
-    else:
-        return False
+    if response.status_code // 200 != 1:
+        return None
+
+    resumable_upload = None
+    for upload in response.json().get("uploads", []):
+        if resumable_upload is None and upload.get("checksum:multihash") == checksum_multihash \
+                and upload.get("number_parts") == number_parts and upload.get("urls") \
+                and all(is_valid_upload_url(url) for url in upload["urls"]):
+            resumable_upload = upload
+        else:
+            get_session().post(
+                url=stac_asset_url + f"/uploads/{upload['upload_id']}/abort",
+                auth=(user, password)
+            )
+
+    return resumable_upload
+
+
+def get_uploaded_parts(stac_asset_url, upload_id):
+    """
+    Returns the parts already uploaded of an in-progress upload, following all the pages of the listing.
 
-    # 3. Upload the part using the presigned url
+    Args:
+        stac_asset_url (str): The URL of the STAC asset.
+        upload_id (str): The ID of the upload.
+
+    Returns:
+        list: The uploaded parts with their ETag and part number, empty if the parts cannot be listed.
+    """
     parts = []
+    url = stac_asset_url + f"/uploads/{upload_id}/parts"
+    params = {"limit": 100}
+    while url is not None:
+        response = get_session().get(
+            url=url,
+            auth=(user, password),
+            params=params
+        )
+        if response.status_code // 200 != 1:
+            return []
+
+        response_json = response.json()
+        parts.extend({"etag": part["etag"], "part_number": part["part_number"]}
+                     for part in response_json.get("parts", []))
+
+        # The link to the next page already contains the query (cursor and limit)
+        url = next((link["href"] for link in response_json.get("links", [])
+                    if link.get("rel") == "next"), None)
+        params = None
+
+    return parts
+
+
+def upload_part(stac_asset_filename, url, md5_part, part_size, number_parts):
+    """
+    Uploads one part of a file using its presigned URL, with retries and exponential backoff.
+
+    Args:
+        stac_asset_filename (str): The filename of the STAC asset to upload.
+        url (dict): The presigned URL of the part as returned by the STAC API.
+        md5_part (str): The MD5 hash of the part.
+        part_size (int): The size of each part in bytes.
+        number_parts (int): The number of parts of the file.
+
+    Returns:
+        dict: The uploaded part with its ETag and part number, None if all attempts failed.
+    """
+    # Only the part is read, so that the memory used is bounded by the number of parallel uploads
     with open(stac_asset_filename, "rb") as fd:
-        for url in urls:
-            data = fd.read(part_size)
-            for attempt in range(attempts):
-                try:
-                    response = requests.put(
-                        url=url["url"],
-                        # proxies={"https": proxy.guess_proxy()},
-                        # verify=False,
-                        data=data,
-                        headers={
-                            "Content-MD5": md5_parts[url["part"] - 1]["md5"]},
-                        timeout=part_size_mb * 2
-                    )
-                    if response.status_code // 200 == 1:
-                        parts.append(
-                            {"etag": response.headers["ETag"], "part_number": url["part"]})
-                        print(
-                            f'Part {url["part"]}/{len(urls)} of File {os.path.basename(stac_asset_filename)} uploaded after attempt {attempt + 1}')
-                        break
-                    elif attempt == attempts - 1:
-                        return False
-                except Exception as e:
-                    print(e)
+        fd.seek((url["part"] - 1) * part_size)
+        data = fd.read(part_size)
+
+    for attempt in range(attempts):
+        try:
+            response = get_session().put(
+                url=url["url"],
+                # proxies={"https": proxy.guess_proxy()},
+                # verify=False,
+                data=data,
+                headers={"Content-MD5": md5_part},
+                timeout=part_size_mb * 2
+            )
+            etag = response.headers.get("ETag")
+            if response.status_code // 200 == 1 and etag:
+                print(
+                    f'Part {url["part"]}/{number_parts} of File {os.path.basename(stac_asset_filename)} uploaded after attempt {attempt + 1}')
+                return {"etag": etag, "part_number": url["part"]}
+            # Without ETag, the part cannot be completed and is uploaded again
+            print(
+                f'Part {url["part"]}/{number_parts} of File {os.path.basename(stac_asset_filename)}: attempt {attempt + 1} failed with status {response.status_code}{"" if etag else " and no ETag"}')
+        except requests.exceptions.RequestException as e:
+            print(e)
+        if attempt < attempts - 1:
+            time.sleep(retry_backoff * 2 ** attempt)
+
+    return None
+
+
+def upload_asset_multipart(stac_asset_filename, stac_asset_url, part_size=part_size_mb * 1024 ** 2):
+    """
+    Uploads a STAC asset in multiple parts.
+
+    This function calculates the SHA256 hash of the file at `stac_asset_filename` and the MD5 hashes of its parts in one pass. It then resumes an interrupted upload of the same file or creates a multipart upload, uploads the missing parts in parallel using the presigned URLs, and completes the upload. If any step fails, it returns False and an interrupted upload is left in progress to be resumed by the next run. Otherwise, it returns True.
+
+    Args:
+        stac_asset_filename (str): The filename of the STAC asset to upload.
+        stac_asset_url (str): The URL where the STAC asset should be uploaded.
+        part_size (int, optional): The size of each part in bytes. Defaults to `part_size_mb * 1024 ** 2`.
+
+    Returns:
+        bool: True if the upload was successful, False otherwise.
+    """
+    # 1. Prepare multipart upload
+    checksum_multihash, md5_parts = get_multipart_checksums(
+        stac_asset_filename, part_size)
+
+    # 2. Resume an interrupted upload of the file or create a multipart upload
+    upload = get_resumable_upload(
+        stac_asset_url, checksum_multihash, len(md5_parts))
+    if upload is not None:
+        parts = get_uploaded_parts(stac_asset_url, upload["upload_id"])
+        print(
+            f'Resuming upload of File {os.path.basename(stac_asset_filename)}: {len(parts)}/{len(md5_parts)} parts already uploaded')
+    else:
+        response = get_session().post(
+            url=stac_asset_url + "/uploads",
+            auth=(user, password),
+            # auth=HTTPBasicAuth(user, password),
+            # proxies={"https": proxy.guess_proxy()},
+            # verify=False,
+            json={"number_parts": len(
+                md5_parts), "md5_parts": md5_parts, "checksum:multihash": checksum_multihash}
+        )
+        if response.status_code // 200 == 1:
+            upload = response.json()
+            parts = []
+        else:
+            return False
+    upload_id = upload["upload_id"]
+    urls = upload["urls"]
+
+    # 3. Upload the missing parts in parallel using the presigned urls
+    uploaded_part_numbers = {part["part_number"] for part in parts}
+    all_uploaded = True
+    with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+        futures = [executor.submit(upload_part, stac_asset_filename, url, md5_parts[url["part"] - 1]["md5"], part_size, len(urls))
+                   for url in urls if url["part"] not in uploaded_part_numbers]
+        for future in as_completed(futures):
+            part = future.result()
+            if part is None:
+                all_uploaded = False
+            else:
+                parts.append(part)
+    if not all_uploaded:
+        return False
+    parts.sort(key=lambda part: part["part_number"])
 
     # 4. Complete the upload
-    response = requests.post(
+    response = get_session().post(
         url=stac_asset_url + f"/uploads/{upload_id}/complete",
         # proxies={"https": proxy.guess_proxy()},
         # verify=False,
@@ -431,7 +616,7 @@ def upload_asset(stac_asset_filename, stac_asset_url):
     """
     Uploads a STAC asset.
 
-    This function prepares a singlepart upload by calculating the SHA256 and MD5 hashes of the file at `stac_asset_filename`. It then creates a multipart upload, uploads the part using the presigned URL, and completes the upload. If any step fails, it returns False. Otherwise, it returns True.
+    This function prepares a singlepart upload by calculating the SHA256 and MD5 hashes of the file at `stac_asset_filename` chunk by chunk. It then creates a multipart upload, streams the file from disk to the presigned URL, and completes the upload. Files larger than `single_part_max_mb` are uploaded with upload_asset_multipart instead. If any step fails, it returns False. Otherwise, it returns True.
 
     Args:
         stac_asset_filename (str): The filename of the STAC asset to upload.
@@ -440,16 +625,23 @@ def upload_asset(stac_asset_filename, stac_asset_url):
     Returns:
         bool: True if the upload was successful, False otherwise.
     """
+    if os.path.getsize(stac_asset_filename) > single_part_max_mb * 1024 ** 2:
+        return upload_asset_multipart(stac_asset_filename, stac_asset_url)
+
     # 1. Prepare singlepart upload
+    sha256 = hashlib.sha256()
+    md5_hash = hashlib.md5()
     with open(stac_asset_filename, 'rb') as fd:
-        data = fd.read()
+        for data in iter(lambda: fd.read(chunk_size_mb * 1024 ** 2), b""):
+            sha256.update(data)
+            md5_hash.update(data)
 
     checksum_multihash = multihash.to_hex_string(
-        multihash.encode(hashlib.sha256(data).digest(), 'sha2-256'))
-    md5 = b64encode(hashlib.md5(data).digest()).decode('utf-8')
+        multihash.encode(sha256.digest(), 'sha2-256'))
+    md5 = b64encode(md5_hash.digest()).decode('utf-8')
 
     # 2. Create a multipart upload
-    response = requests.post(
+    response = get_session().post(
         stac_asset_url + "/uploads",
         auth=(user, password),
         json={
@@ -461,15 +653,20 @@ def upload_asset(stac_asset_filename, stac_asset_url):
             "checksum:multihash": checksum_multihash
         }
     )
+    if response.status_code // 200 != 1:
+        return False
     upload_id = response.json()['upload_id']
 
-    # 2. Upload the part using the presigned url
-    response = requests.put(
-        response.json()['urls'][0]['url'], data=data, headers={'Content-MD5': md5})
-    etag = response.headers['ETag']
+    # 2. Upload the part using the presigned url, the file is streamed from disk
+    with open(stac_asset_filename, 'rb') as fd:
+        response = get_session().put(
+            response.json()['urls'][0]['url'], data=fd, headers={'Content-MD5': md5})
+    etag = response.headers.get('ETag')
+    if response.status_code // 200 != 1 or not etag:
+        return False
 
     # 3. Complete the upload
-    response = requests.post(
+    response = get_session().post(
         f"{stac_asset_url}/uploads/{upload_id}/complete",
         auth=(user, password),
         json={'parts': [{'etag': etag, 'part_number': 1}]}
@@ -481,123 +678,190 @@ def upload_asset(stac_asset_filename, stac_asset_url):
         return False
 
 
-def publish_to_stac(raw_asset, raw_item, collection, geocat_id):
+def initialize_session():
     """
-    Publishes a STAC asset. 
-
-    This function determines the run type, initializes FSDI authentication, checks if the STAC item exists and creates it if it doesn't, checks if the STAC asset exists and overwrites it if it does, and finally uploads the STAC asset.
+    Initializes the publishing session once per run: determines the run type, gets the FSDI credentials and opens the HTTP session.
 
     Args:
-        raw_asset (str): The filename of the raw asset to publish.
-        raw_item (str): The raw item associated with the asset.
-        collection (str): The collection to which the asset belongs.
-        geocat_id (str): The Geocat ID of the asset.
+        None
 
     Returns:
         None
     """
+    if session is not None:
+        return
+
     # Test if we are on Local DEV Run or if we are on PROD
     determine_run_type()
 
     # Get FSDI credentials
     initialize_fsdi()
 
-    # STAC FSDI only allows lower case item, so we rename it here temporarely
-    item = raw_item.lower()
-    asset = raw_asset.lower()
-    os.rename(raw_asset, asset)
+    get_session()
 
-    item_title = collection.replace('ch.swisstopo.', '')+"_" + item
-    item_path = f'collections/{collection}/items/{item}'
-    # Get path
-    asset_path = f'collections/{collection}/items/{item}/assets/{asset}'
-    stac_path = f"{config.STAC_FSDI_SCHEME}://{config.STAC_FSDI_HOSTNAME}{config.STAC_FSDI_API}"
 
+def get_asset_type(asset):
+    """
+    Returns the type of a STAC asset based on its file extension.
+
+    Args:
+        asset (str): The filename of the asset.
+
+    Returns:
+        str: 'CSV', 'JSON', 'JPEG' or 'TIF'.
+    """
     # Get the file extension
     extension = asset.split('.')[-1]
 
     # Assign different values based on the extension
     if extension.lower() == 'csv':
-        asset_type = 'CSV'
+        return 'CSV'
     elif extension.lower() == 'json':
-        asset_type = 'JSON'
+        return 'JSON'
     elif extension.lower() == 'jpg':
-        asset_type = 'JPEG'
+        return 'JPEG'
     else:
-        asset_type = 'TIF'
+        return 'TIF'
+
+
+def create_item(raw_asset, raw_item, item, item_title, item_url, geocat_id):
+    """
+    Creates a STAC item using the bounds of a GeoTIFF asset.
+
+    Args:
+        raw_asset (str): The filename of the GeoTIFF asset.
+        raw_item (str): The raw item, e.g. '2023-10-28T102039'.
+        item (str): The lower case item.
+        item_title (str): The title of the item.
+        item_url (str): The URL of the item.
+        geocat_id (str): The Geocat ID of the item.
+
+    Returns:
+        bool: True if the item was created, False otherwise.
+    """
+    try:
+        print(f"ITEM object {item}: creating")
+        # Create payload
+        # Getting the bounds
+        # Open the GeoTIFF file
+        with rasterio.open(raw_asset) as ds:
+            # Get the bounds of the raster
+            left, bottom, right, top = ds.bounds
+
+        # Create a list of coordinates (in this case, a rectangle)
+        coordinates_lv95 = [
+            [left, bottom],
+            [right, bottom],
+            [right, top],
+            [left, top],
+            [left, bottom]
+        ]
+        # Convert your coordinates
+        coordinates_wgs84 = [transformer_lv95_to_wgs84.transform(
+            *coord) for coord in coordinates_lv95]
+
+        # Date: Convert the string to a datetime object
+        dt = datetime.strptime(raw_item, '%Y-%m-%dT%H%M%S')
+
+        # Convert the datetime object back to a string in the desired format
+        dt_iso8601 = dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        payload = item_create_json_payload(
+            item, coordinates_wgs84, dt_iso8601, item_title, geocat_id)
+
+        return upload_item(item_url, payload) is True
+
+    except Exception as e:
+        print(f"An error occurred creating object {item}: {e}")
+        return False
+
+
+def publish_assets_to_stac(raw_assets, raw_item, collection, geocat_id):
+    """
+    Publishes a batch of STAC assets of the same item.
+
+    This function initializes the publishing session once per run, checks once per run if the STAC item exists and creates it from the first GeoTIFF asset if it doesn't, and then creates and uploads each asset, overwriting it if it exists.
+    STAC FSDI only allows lower case items and assets: the assets are uploaded under their lower case name, the files are not renamed.
+
+    Args:
+        raw_assets (list): The filenames of the raw assets to publish, GeoTIFF assets first.
+        raw_item (str): The raw item associated with the assets.
+        collection (str): The collection to which the assets belong.
+        geocat_id (str): The Geocat ID of the assets.
+
+    Returns:
+        bool: True if the item exists and all assets were created and uploaded, False otherwise. An interrupted
+        multipart upload is left in progress to be resumed by the next run.
+    """
+    initialize_session()
+
+    item = raw_item.lower()
+    item_title = collection.replace('ch.swisstopo.', '')+"_" + item
+    item_path = f'collections/{collection}/items/{item}'
+    stac_path = f"{config.STAC_FSDI_SCHEME}://{config.STAC_FSDI_HOSTNAME}{config.STAC_FSDI_API}"
 
     # ITEM
     #############
 
     # Check if ITEM exists, if not create it first
 
-    if is_existing(stac_path+item_path):
+    if stac_path+item_path in existing_items:
+        print(f"ITEM object {stac_path+item_path}: exists")
+    elif is_existing(stac_path+item_path):
         print(f"ITEM object {stac_path+item_path}: exists")
+        existing_items.add(stac_path+item_path)
     else:
-        try:
-            if asset_type == 'TIF':
-                print(f"ITEM object {item}: creating")
-                # Create payload
-                # Getting the bounds
-                # Open the GeoTIFF file
-                with rasterio.open(asset) as ds:
-                    # Get the bounds of the raster
-                    left, bottom, right, top = ds.bounds
-
-                # Create a list of coordinates (in this case, a rectangle)
-                coordinates_lv95 = [
-                    [left, bottom],
-                    [right, bottom],
-                    [right, top],
-                    [left, top],
-                    [left, bottom]
-                ]
-                # Convert your coordinates
-                coordinates_wgs84 = [transformer_lv95_to_wgs84.transform(
-                    *coord) for coord in coordinates_lv95]
-
-                # Date: Convert the string to a datetime object
-                dt = datetime.strptime(raw_item, '%Y-%m-%dT%H%M%S')
-
-                # Convert the datetime object back to a string in the desired format
-                dt_iso8601 = dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-                payload = item_create_json_payload(
-                    item, coordinates_wgs84, dt_iso8601, item_title, geocat_id)
-
-                upload_item(stac_path+item_path, payload)
-
-        except Exception as e:
-            print(f"An error occurred creating object {item}: {e}")
+        tif_assets = [raw_asset for raw_asset in raw_assets if get_asset_type(
+            os.path.basename(raw_asset).lower()) == 'TIF']
+        if tif_assets and create_item(tif_assets[0], raw_item, item, item_title, stac_path+item_path, geocat_id):
+            existing_items.add(stac_path+item_path)
+        else:
+            print(f"ITEM object {stac_path+item_path}: creation FAILED")
+            return False
 
     # ASSET
     #############
 
-    # Check if ASSET exists, if not upload it
-
-    if is_existing(f"{config.STAC_FSDI_SCHEME}://{config.STAC_FSDI_HOSTNAME}/{collection}/{item}/{asset}"):
-        print(f"ASSET object {asset}: exists ... overwriting")
-    else:
-        print(f"ASSET object {asset}: does not exist preparing...")
+    for raw_asset in raw_assets:
+        asset = os.path.basename(raw_asset).lower()
+        asset_type = get_asset_type(asset)
+        asset_path = f'collections/{collection}/items/{item}/assets/{asset}'
 
-    # create asset payload
-    payload = asset_create_json_payload(asset, asset_type)
+        # create asset payload
+        payload = asset_create_json_payload(asset, asset_type)
 
-    # Create Asset
-    if not create_asset(stac_path+asset_path, payload):
-        print(f"ASSET object {asset}: creation FAILED")
+        # Create Asset, overwriting it if it exists
+        if not create_asset(stac_path+asset_path, payload):
+            print(f"ASSET object {asset}: creation FAILED")
+            return False
 
-    # Upload ASSET
-    if asset_type == 'TIF':
-        print("TIF asset - Multipart upload")
-        if not upload_asset_multipart(asset, stac_path+asset_path):
-            print(f"ASSET object {asset}: upload FAILED")
-    else:
-        print(asset_type+" single part upload")
-        if not upload_asset(asset, stac_path+asset_path):
+        # Upload ASSET
+        if asset_type == 'TIF':
+            print("TIF asset - Multipart upload")
+            uploaded = upload_asset_multipart(raw_asset, stac_path+asset_path)
+        else:
+            print(asset_type+" single part upload")
+            uploaded = upload_asset(raw_asset, stac_path+asset_path)
+        if not uploaded:
             print(f"ASSET object {asset}: upload FAILED")
-    print("FSDI update done: " +
-          f"{config.STAC_FSDI_SCHEME}://{config.STAC_FSDI_HOSTNAME}/{collection}/{item}/{asset}")
+            return False
+        print("FSDI update done: " +
+              f"{config.STAC_FSDI_SCHEME}://{config.STAC_FSDI_HOSTNAME}/{collection}/{item}/{asset}")
+
+    return True
 
-    # rename it back to the orginal name for further processing
-    os.rename(asset, raw_asset)
+
+def publish_to_stac(raw_asset, raw_item, collection, geocat_id):
+    """
+    Publishes a STAC asset, see publish_assets_to_stac().
+
+    Args:
+        raw_asset (str): The filename of the raw asset to publish.
+        raw_item (str): The raw item associated with the asset.
+        collection (str): The collection to which the asset belongs.
+        geocat_id (str): The Geocat ID of the asset.
+
+    Returns:
+        bool: True if the asset was published, False otherwise.
+    """
+    return publish_assets_to_stac([raw_asset], raw_item, collection, geocat_id)
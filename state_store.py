@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite state store of the SATROMO processing chain.
+
+The store keeps the bookkeeping of the processor, the publisher and step0 in one transactional database (config.STATE_DB):
+- running_tasks: GEE export tasks started by the processor and not yet published
+- completed_tasks: status of the GEE tasks which are completed
+- product_updates: last scene date, run date and status of each product
+- empty_assets: step0 dates for which no asset is expected (no scene, too cloudy)
+
+All lookups are indexed. On first use, the store is created and filled once from the CSV files previously used
+(config.GEE_RUNNING_TASKS, config.GEE_COMPLETED_TASKS, config.LAST_PRODUCT_UPDATES, config.EMPTY_ASSET_LIST).
+These CSV files are deprecated: they are no longer written and will be removed once the state store is committed.
+"""
+import os
+import csv
+import json
+import sqlite3
+import threading
+import configuration as config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS running_tasks (
+    task_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS running_tasks_filename ON running_tasks (filename);
+
+CREATE TABLE IF NOT EXISTS completed_tasks (
+    name TEXT,
+    id TEXT,
+    description TEXT,
+    state TEXT,
+    task_status TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS completed_tasks_name ON completed_tasks (name);
+CREATE INDEX IF NOT EXISTS completed_tasks_id ON completed_tasks (id);
+
+CREATE TABLE IF NOT EXISTS product_updates (
+    product TEXT PRIMARY KEY,
+    last_scene_date TEXT,
+    run_date TEXT,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS empty_assets (
+    collection TEXT NOT NULL,
+    date TEXT NOT NULL,
+    remark TEXT,
+    PRIMARY KEY (collection, date)
+);
+"""
+
+# Connection shared by all threads of the process, see get_connection()
+connection = None
+connection_lock = threading.RLock()
+
+
+def get_connection():
+    """
+    Opens the state store, creating it and migrating the CSV files if it does not exist yet.
+
+    Returns:
+        sqlite3.Connection: The connection to the state store.
+    """
+    global connection
+    with connection_lock:
+        if connection is None:
+            is_new = not os.path.exists(config.STATE_DB)
+            # The timeout lets concurrent writers (processor, publisher) wait for each other's transactions
+            connection = sqlite3.connect(
+                config.STATE_DB, timeout=60, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.executescript(SCHEMA)
+            if is_new:
+                try:
+                    migrate_csv_files()
+                except Exception:
+                    # Remove the incomplete store so that the migration is run again next time
+                    connection.close()
+                    connection = None
+                    os.remove(config.STATE_DB)
+                    raise
+    return connection
+
+
+def execute(sql, parameters=()):
+    """
+    Executes a statement in its own transaction.
+
+    Args:
+        sql (str): The SQL statement.
+        parameters (tuple): The parameters of the statement.
+
+    Returns:
+        list: The resulting rows.
+    """
+    with connection_lock:
+        db = get_connection()
+        with db:
+            return db.execute(sql, parameters).fetchall()
+
+
+def read_csv_rows(filename):
+    """
+    Reads the non-empty rows of a CSV file with header.
+
+    Args:
+        filename (str): Path of the CSV file.
+
+    Returns:
+        list: The rows as dictionaries, empty if the file does not exist.
+    """
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, "r", newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if any(row.values())]
+
+
+def migrate_csv_files():
+    """
+    Fills the state store once from the CSV files previously used for the bookkeeping.
+
+    Returns:
+        None
+    """
+    db = connection
+    with db:
+        for row in read_csv_rows(config.GEE_RUNNING_TASKS):
+            db.execute("INSERT OR IGNORE INTO running_tasks (task_id, filename) VALUES (?, ?)",
+                       (row["Task ID"].strip(), row["Filename"].strip()))
+        for row in read_csv_rows(config.GEE_COMPLETED_TASKS):
+            insert_completed_task(db, row)
+        for row in read_csv_rows(config.LAST_PRODUCT_UPDATES):
+            db.execute("INSERT OR REPLACE INTO product_updates (product, last_scene_date, run_date, status) VALUES (?, ?, ?, ?)",
+                       (row["Product"], row["LastSceneDate"], row["RunDate"], row["Status"]))
+        for row in read_csv_rows(config.EMPTY_ASSET_LIST):
+            db.execute("INSERT OR IGNORE INTO empty_assets (collection, date, remark) VALUES (?, ?, ?)",
+                       (row["collection"], row["date"], row["remark"]))
+    print("State store {} created from the CSV files".format(config.STATE_DB))
+
+
+# RUNNING TASKS
+#############
+
+def add_running_tasks(running_tasks):
+    """
+    Adds started GEE tasks in a single transaction.
+
+    Args:
+        running_tasks (list): List of (task_id, filename) tuples.
+
+    Returns:
+        None
+    """
+    with connection_lock:
+        db = get_connection()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO running_tasks (task_id, filename) VALUES (?, ?)",
+                           running_tasks)
+
+
+def get_running_tasks():
+    """
+    Returns all running GEE tasks, in the order they were started.
+
+    Returns:
+        list: List of (task_id, filename) tuples.
+    """
+    rows = execute(
+        "SELECT task_id, filename FROM running_tasks ORDER BY rowid")
+    return [(row["task_id"], row["filename"]) for row in rows]
+
+
+def get_running_task_id(filename):
+    """
+    Returns the Task ID of the running task exporting a file.
+
+    Args:
+        filename (str): The filename of the export, including the tile suffix.
+
+    Returns:
+        str: The Task ID, None if there is no running task for the file.
+    """
+    rows = execute(
+        "SELECT task_id FROM running_tasks WHERE filename = ? ORDER BY rowid LIMIT 1", (filename,))
+    return rows[0]["task_id"] if rows else None
+
+
+def delete_running_task(task_id):
+    """
+    Removes a task from the running tasks.
+
+    Args:
+        task_id (str): The Task ID.
+
+    Returns:
+        None
+    """
+    execute("DELETE FROM running_tasks WHERE task_id = ?", (task_id,))
+
+
+# COMPLETED TASKS
+#############
+
+# Names of the completed tasks, loaded once, see get_completed_task_names()
+completed_task_names = None
+
+def insert_completed_task(db, task_status):
+    """
+    Inserts a task status in the completed tasks, ignoring tasks which are already stored.
+
+    Args:
+        db (sqlite3.Connection): The connection to use, within a transaction.
+        task_status (dict): The task status as returned by ee.data.getTaskStatus.
+
+    Returns:
+        None
+    """
+    db.execute("INSERT OR IGNORE INTO completed_tasks (name, id, description, state, task_status) VALUES (?, ?, ?, ?, ?)",
+               (task_status.get("name"), task_status.get("id"), task_status.get("description"),
+                task_status.get("state"), json.dumps(task_status)))
+
+
+def get_completed_task_names():
+    """
+    Returns the names of the completed tasks, loaded once from the state store.
+
+    Returns:
+        set: The names of the completed tasks.
+    """
+    global completed_task_names
+    with connection_lock:
+        if completed_task_names is None:
+            completed_task_names = {row["name"] for row in execute(
+                "SELECT name FROM completed_tasks")}
+        return completed_task_names
+
+
+def add_completed_tasks(task_statuses):
+    """
+    Stores the status of completed GEE tasks in a single transaction.
+
+    Args:
+        task_statuses (list): The task statuses as returned by ee.data.getTaskStatus.
+
+    Returns:
+        None
+    """
+    with connection_lock:
+        cached_names = get_completed_task_names()
+        db = get_connection()
+        with db:
+            for task_status in task_statuses:
+                insert_completed_task(db, task_status)
+        cached_names.update(task_status.get("name")
+                            for task_status in task_statuses)
+
+
+def add_completed_task(task_status):
+    """
+    Stores the status of a completed GEE task.
+
+    Args:
+        task_status (dict): The task status as returned by ee.data.getTaskStatus.
+
+    Returns:
+        None
+    """
+    add_completed_tasks([task_status])
+
+
+def is_completed_task(name):
+    """
+    Checks if a task is stored in the completed tasks.
+
+    Args:
+        name (str): The name of the task, e.g. 'projects/earthengine-legacy/operations/<ID>'.
+
+    Returns:
+        bool: True if the task is stored.
+    """
+    return name in get_completed_task_names()
+
+
+# PRODUCT UPDATES
+#############
+
+# In-memory copy of the product_updates table keyed by product, see get_product_updates()
+product_updates = None
+# Modification time of the state store when product_updates was loaded or last written by this process
+product_updates_mtime = None
+
+
+def get_state_db_mtime():
+    """
+    Returns the modification time of the state store file.
+
+    Returns:
+        int: The modification time in nanoseconds, None if the file does not exist.
+    """
+    try:
+        return os.stat(config.STATE_DB).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_product_updates():
+    """
+    Returns the last update of all products, loaded once and served from memory.
+    The table is reloaded when the state store was modified by another process since it was loaded.
+
+    Returns:
+        dict: Dictionary keyed by product name with 'Product', 'LastSceneDate', 'RunDate' and 'Status' of each product.
+    """
+    global product_updates, product_updates_mtime
+    with connection_lock:
+        get_connection()
+        mtime = get_state_db_mtime()
+        if product_updates is None or mtime != product_updates_mtime:
+            rows = execute(
+                "SELECT product, last_scene_date, run_date, status FROM product_updates")
+            product_updates = {row["product"]: {'Product': row["product"], 'LastSceneDate': row["last_scene_date"],
+                                                'RunDate': row["run_date"], 'Status': row["status"]} for row in rows}
+            product_updates_mtime = mtime
+        return product_updates
+
+
+def get_product_update(product_name):
+    """
+    Returns the last update of a product.
+
+    Args:
+        product_name (str): The product name.
+
+    Returns:
+        dict: Dictionary with 'Product', 'LastSceneDate', 'RunDate' and 'Status', None if the product is unknown.
+    """
+    product_update = get_product_updates().get(product_name)
+    return dict(product_update) if product_update is not None else None
+
+
+def set_product_update(product_status):
+    """
+    Inserts or replaces the last update of a product.
+
+    Args:
+        product_status (dict): Dictionary with 'Product', 'LastSceneDate', 'RunDate' and 'Status'.
+
+    Returns:
+        None
+    """
+    global product_updates_mtime
+    with connection_lock:
+        cached_updates = get_product_updates()
+        execute("INSERT OR REPLACE INTO product_updates (product, last_scene_date, run_date, status) VALUES (?, ?, ?, ?)",
+                (product_status['Product'], product_status['LastSceneDate'], product_status['RunDate'], product_status['Status']))
+        cached_updates[product_status['Product']] = {
+            key: product_status[key] for key in ('Product', 'LastSceneDate', 'RunDate', 'Status')}
+        product_updates_mtime = get_state_db_mtime()
+
+
+def set_product_status(product_name, status):
+    """
+    Sets the status of a product, e.g. from 'RUNNING' to 'complete'.
+
+    Args:
+        product_name (str): The product name.
+        status (str): The new status.
+
+    Returns:
+        None
+    """
+    global product_updates_mtime
+    with connection_lock:
+        cached_updates = get_product_updates()
+        execute("UPDATE product_updates SET status = ? WHERE product = ?",
+                (status, product_name))
+        if product_name in cached_updates:
+            cached_updates[product_name]['Status'] = status
+        product_updates_mtime = get_state_db_mtime()
+
+
+# EMPTY ASSETS
+#############
+
+# (collection, date) of the empty step0 assets, loaded once, see get_empty_assets()
+empty_assets = None
+
+
+def get_empty_assets():
+    """
+    Returns the step0 dates registered as empty, loaded once from the state store.
+
+    Returns:
+        set: Set of (collection, date) tuples.
+    """
+    global empty_assets
+    with connection_lock:
+        if empty_assets is None:
+            empty_assets = {(row["collection"], row["date"]) for row in execute(
+                "SELECT collection, date FROM empty_assets")}
+        return empty_assets
+
+
+def add_empty_asset(collection, date, remark):
+    """
+    Registers a step0 date for which no asset will be generated.
+
+    Args:
+        collection (str): The basename of the step0 collection.
+        date (str): The date in the format "YYYY-MM-DD".
+        remark (str): The reason, e.g. 'cloudy'.
+
+    Returns:
+        None
+    """
+    with connection_lock:
+        cached_empty_assets = get_empty_assets()
+        execute("INSERT OR REPLACE INTO empty_assets (collection, date, remark) VALUES (?, ?, ?)",
+                (collection, date, remark))
+        cached_empty_assets.add((collection, date))
+
+
+def is_empty_asset(collection, date):
+    """
+    Checks if a step0 date is registered as empty.
+
+    Args:
+        collection (str): The basename of the step0 collection.
+        date (str): The date in the format "YYYY-MM-DD".
+
+    Returns:
+        bool: True if no asset is expected for the date.
+    """
+    return (collection, date) in get_empty_assets()
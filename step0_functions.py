@@ -1,10 +1,21 @@
 import os
-import pandas as pd
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import configuration as config
+import state_store
 import ee
 from datetime import datetime, timedelta
 from step0_processors import *
-from satromo_publish import write_file
+
+# Asset catalog of each step0 collection, listed once per run, see get_asset_catalog()
+asset_catalogs = {}
+# Export operations by description prefix "<collection>_<date>", listed once per run, see get_operations_index()
+operations_index = None
+# Completed operations whose status is not stored yet by operation name, see write_completed_tasks()
+new_completed_tasks = {}
+# Number of dates whose asset generation was started in this run, see backfill_collection()
+launched_dates = 0
 
 
 def step0_main(step0_product_dict, current_date_str):
@@ -18,12 +29,74 @@ def step0_main(step0_product_dict, current_date_str):
         if ok:
             collections_ready.append(step0_collection)
 
+    # Store the status of the tasks completed since the last run
+    write_completed_tasks()
+
     return collections_ready
 
 
+def get_asset_resolution(asset):
+    """
+    Returns the resolution of a step0 asset from the suffix of its ID, e.g. '10m' for '..._bands-10m'.
+
+    Args:
+        asset (dict): The asset as returned by ee.data.listAssets.
+
+    Returns:
+        str: The resolution, None if the ID has no resolution suffix.
+    """
+    match = re.search(r'-(\d+m)$', asset['id'])
+    return match.group(1) if match else None
+
+
+def get_asset_catalog(collection):
+    """
+    Returns the assets of a step0 collection indexed by date and resolution.
+    The collection is listed once per run, ee.data.listAssets follows all the pages when no pageSize is given.
+
+    Args:
+        collection (str): The step0 collection.
+
+    Returns:
+        dict: Dictionary {date: {resolution: asset}}, the date in the format "YYYY-MM-DD".
+    """
+    if collection not in asset_catalogs:
+        assets_by_date = {}
+        for asset in ee.data.listAssets({'parent': collection})['assets']:
+            assets_by_date.setdefault(asset['properties']['date'], {})[
+                get_asset_resolution(asset)] = asset
+        asset_catalogs[collection] = assets_by_date
+
+    return asset_catalogs[collection]
+
+
+def get_operations_index():
+    """
+    Returns the export operations of the project indexed by the prefix "<collection>_<date>" of their description,
+    e.g. "COL_S2_SR_HARMONIZED_SWISS_2024-02-25" for the task "COL_S2_SR_HARMONIZED_SWISS_2024-02-25_10m".
+    The operations are listed once per run.
+
+    Returns:
+        dict: Dictionary {description prefix: list of operations}.
+    """
+    global operations_index
+
+    if operations_index is None:
+        operations_index = {}
+        for task in ee.data.listOperations():
+            metadata = task.get('metadata', {})
+            if not metadata.get('type', '').startswith('EXPORT'):
+                continue
+            match = re.match(r'^(.*_\d{4}-\d{2}-\d{2})',
+                             metadata.get('description', ''))
+            if match:
+                operations_index.setdefault(match.group(1), []).append(task)
+
+    return operations_index
+
+
 def step0_check_collection(collection, temporal_coverage, current_date_str):
-    list_asset_response = ee.data.listAssets({'parent': collection})
-    assets = list_asset_response['assets']
+    assets_by_date = get_asset_catalog(collection)
     target_date = datetime.strptime(current_date_str, "%Y-%m-%d").date()
 
     # asset_cleaning
@@ -31,85 +104,189 @@ def step0_check_collection(collection, temporal_coverage, current_date_str):
         target_date = target_date + \
             timedelta(
                 days=-1 * config.step0[collection]['cleaning_older_than'])
-        for asset in assets:
-            date = asset['properties']['date']
+        for date, assets in assets_by_date.items():
             date_as_datetime = datetime.strptime(date, '%Y-%m-%d')
             if date_as_datetime < target_date:
                 print('remove asset {}'.format(date))
                 print(
                     'XXX Actual asset deletion is not activated. Uncomment the code to do so XXXX')
-                # ee.data.deleteAsset(assetId=asset['id']) TODO uncomment this line to actually delete the assets
+                # for asset in assets.values(): ee.data.deleteAsset(assetId=asset['id']) TODO uncomment this line to actually delete the assets
 
     # Check that asset is present for every date of the temporal coverage
     check_date = target_date + timedelta(days=-1*temporal_coverage)
     end_date = target_date
     all_present = True
-    tasks = ee.data.listOperations()
+    missing_dates = []
+    tasks_by_description = get_operations_index()
     while check_date <= end_date:
-        asset_prepared = check_if_asset_prepared(
-            collection, assets, check_date, tasks)
-        if not asset_prepared:
+        asset_state = get_asset_state(
+            collection, assets_by_date, check_date, tasks_by_description)
+        if asset_state == 'MISSING':
+            missing_dates.append(check_date.strftime('%Y-%m-%d'))
+        elif asset_state == 'RUNNING':
             print('Asset not yet available for date {}'.format(check_date))
             all_present = False
         check_date += timedelta(days=1)
 
+    # Start the generation of the missing assets, dates found empty meanwhile are present
+    backfill_collection(collection, missing_dates)
+    for missing_date in missing_dates:
+        if not state_store.is_empty_asset(os.path.basename(collection), missing_date):
+            print('Asset not yet available for date {}'.format(missing_date))
+            all_present = False
+
     return all_present
 
 
-def check_if_asset_prepared(collection, assets, check_date, tasks):
-    # 1. we start by checking the state of the task
-    #    (we start by that to fill the completed_tasks.csv if needed)
-    # 2. if not running, check if the asset is already available
-    # 3. if not in the available asset list ,check if in empty_asset_list
-    # 4. if not in running tasks, start task (if empty, write the empty_asset_list)
+def get_asset_state(collection, assets_by_date, check_date, tasks_by_description):
+    """
+    Checks the asset of a step0 collection for a date:
+    1. we start by checking the state of the task
+       (we start by that to fill the completed tasks if needed)
+    2. if not running, check if the asset is already available in all the resolutions of
+       config.step0[collection]['asset_resolutions']
+    3. if not in the available asset list ,check if in empty_asset_list
+
+    Args:
+        collection (str): The step0 collection.
+        assets_by_date (dict): The assets of the collection by date, see get_asset_catalog().
+        check_date (datetime.date): The date to check.
+        tasks_by_description (dict): The export operations by description prefix, see get_operations_index().
+
+    Returns:
+        str: 'READY' if the asset is available in all resolutions or registered as empty, 'RUNNING' if its
+        generation is running, 'MISSING' if it has to be generated.
+    """
     check_date_str = check_date.strftime('%Y-%m-%d')
     print('checking date {}'.format(check_date))
 
     collection_basename = os.path.basename(collection)
     task_description = collection_basename + '_' + check_date_str
-    for task in tasks:
-        if task_description in task['metadata']['description']:
-            continue
+    # Only the tasks of the date are considered, e.g. <collection>_<date>_10m and <collection>_<date>_20m
+    for task in tasks_by_description.get(task_description, []):
         if task['metadata']['state'] in ['PENDING', 'RUNNING']:
             print('task {} still running, skipping asset creation'.format(
                 task_description))
-            return False
+            return 'RUNNING'
         if task['metadata']['state'] in ['COMPLETE', 'SUCCEEDED']:
-            write_task_metadata_if_needed(task)
+            register_completed_task(task)
             # we don't return here. Maybe the asset was deleted and need to be restored.
 
-    # 1. check if in asset list
-    for asset in assets:
-        asset_date = asset['properties']['date']
-        if asset_date == check_date_str:
-            print('Collection {} READY for date {}'.format(
-                collection, check_date_str))
-            return True
-    print('Asset not found in custom collection, continuing...')
+    # 1. check if all the resolutions of the date are in the asset list
+    assets = assets_by_date.get(check_date_str, {})
+    missing_resolutions = [resolution for resolution in config.step0[collection]['asset_resolutions']
+                           if resolution not in assets]
+    if not missing_resolutions:
+        print('Collection {} READY for date {}'.format(
+            collection, check_date_str))
+        return 'READY'
+    if assets:
+        print('Asset incomplete in custom collection, missing {}, continuing...'.format(
+            ', '.join(missing_resolutions)))
+    else:
+        print('Asset not found in custom collection, continuing...')
 
     # 2. if not in asset list check if in empty_asset_list
-    df = pd.read_csv(config.EMPTY_ASSET_LIST)
-
-    df_selection = df[(df.collection == collection_basename)
-                      & (df.date == check_date_str)]
-    if len(df_selection) > 0:
+    if state_store.is_empty_asset(collection_basename, check_date_str):
         print('Date found in empty_asset_list, skipping date')
-        return True
+        return 'READY'
+
+    return 'MISSING'
+
+
+def count_running_dates(tasks_by_description):
+    """
+    Counts the dates whose step0 export tasks are pending or running, over all step0 collections of the configuration.
+    Other export tasks of the project (products, other collections) are not counted.
+
+    Args:
+        tasks_by_description (dict): The export operations by description prefix, see get_operations_index().
+
+    Returns:
+        int: The number of dates with pending or running step0 tasks.
+    """
+    step0_basenames = {os.path.basename(collection) for collection in config.step0}
+    return sum(1 for description, tasks in tasks_by_description.items()
+               if description.rsplit('_', 1)[0] in step0_basenames
+               and any(task['metadata']['state'] in ['PENDING', 'RUNNING'] for task in tasks))
+
+
+def backfill_collection(collection, missing_dates):
+    """
+    Starts the generation of the missing assets of a step0 collection, most recent dates first and concurrently
+    (config.STEP0_MAX_WORKERS). The number of dates with running tasks is kept under config.STEP0_MAX_RUNNING_DATES,
+    the remaining dates are generated by the next runs.
+
+    Args:
+        collection (str): The step0 collection.
+        missing_dates (list): The dates without asset, in the format "YYYY-MM-DD".
+
+    Returns:
+        None
+    """
+    global launched_dates
+
+    if not missing_dates:
+        return
+
+    available_slots = max(0, config.STEP0_MAX_RUNNING_DATES -
+                          count_running_dates(get_operations_index()) - launched_dates)
+    missing_dates = sorted(missing_dates, reverse=True)
+    planned_dates = missing_dates[:available_slots]
+    for missing_date in missing_dates[available_slots:]:
+        print('Asset generation for {} / {} deferred to the next run, limit of {} running dates reached'.format(
+            collection, missing_date, config.STEP0_MAX_RUNNING_DATES))
 
-    print('Starting asset generation for {} / {}'.format(collection, check_date_str))
     generate_single_date_function = eval(
         config.step0[collection]['step0_function'])
-    generate_single_date_function(check_date_str, collection, task_description)
-    return False
+    collection_basename = os.path.basename(collection)
+
+    with ThreadPoolExecutor(max_workers=config.STEP0_MAX_WORKERS) as executor:
+        futures = {}
+        for planned_date in planned_dates:
+            print('Starting asset generation for {} / {}'.format(collection, planned_date))
+            futures[executor.submit(generate_single_date_function, planned_date, collection,
+                                    collection_basename + '_' + planned_date)] = planned_date
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                print('Asset generation FAILED for {} / {}'.format(collection, futures[future]))
+                traceback.print_exc()
+
+    launched_dates += len(planned_dates)
+
+
+def register_completed_task(task):
+    """
+    Registers a completed task whose status has to be stored, unless it is already stored.
 
+    Args:
+        task (dict): The operation as returned by ee.data.listOperations.
 
-def write_task_metadata_if_needed(task):
-    completed_task_df = pd.read_csv(config.GEE_COMPLETED_TASKS)
-    if task['name'] in completed_task_df.name.values:
+    Returns:
+        None
+    """
+    if state_store.is_completed_task(task['name']):
+        return
+    new_completed_tasks[task['name']] = task
+
+
+def write_completed_tasks():
+    """
+    Stores the status of all registered completed tasks in a single transaction.
+    The operations already listed are converted to task statuses locally, the same way ee.data.getTaskStatus
+    does, so no additional request is sent to GEE.
+
+    Returns:
+        None
+    """
+    if not new_completed_tasks:
         return
-    file_task_id = os.path.basename(task['name'])
-    file_task_status = ee.data.getTaskStatus(file_task_id)[0]
-    write_file(file_task_status, config.GEE_COMPLETED_TASKS)
+    task_statuses = [ee._cloud_api_utils.convert_operation_to_task(task)
+                     for task in new_completed_tasks.values()]
+    state_store.add_completed_tasks(task_statuses)
+    new_completed_tasks.clear()
 
 
 def get_step0_dict():
@@ -0,0 +1,148 @@
+import datetime
+import json
+import os
+import sys
+import types
+
+import pytest
+
+# The configuration is selected by the first command-line argument (see configuration/__init__.py),
+# the tests run with the default dev_config whatever the arguments given to pytest
+sys.argv = sys.argv[:1]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Operations recorded from ee.data.listOperations()
+LIST_OPERATIONS = os.path.join(os.path.dirname(__file__), 'fixtures', 'list_operations.json')
+
+
+@pytest.fixture
+def state_db(tmp_path, monkeypatch):
+    """
+    Points the state store to an empty database in a temporary directory.
+    """
+    import configuration as config
+    import state_store
+
+    monkeypatch.setattr(config, 'STATE_DB', str(tmp_path / 'state.db'))
+    for csv_file in ['GEE_RUNNING_TASKS', 'GEE_COMPLETED_TASKS', 'LAST_PRODUCT_UPDATES', 'EMPTY_ASSET_LIST']:
+        monkeypatch.setattr(config, csv_file, str(tmp_path / (csv_file.lower() + '.csv')))
+    for cache in ['connection', 'completed_task_names', 'product_updates', 'product_updates_mtime',
+                  'empty_assets']:
+        monkeypatch.setattr(state_store, cache, None)
+
+    yield state_store
+
+    if state_store.connection is not None:
+        state_store.connection.close()
+
+
+@pytest.fixture
+def list_operations():
+    """
+    Returns the recorded operations of the GEE task queue.
+    """
+    with open(LIST_OPERATIONS) as f:
+        return json.load(f)
+
+
+def evaluate(value):
+    """
+    Evaluates a value of the fake EE client, like the server would for getInfo().
+    """
+    if isinstance(value, FakeValue):
+        return evaluate(value.compute())
+    if isinstance(value, dict):
+        return {key: evaluate(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [evaluate(item) for item in value]
+    return value
+
+
+class FakeValue:
+    """
+    Server-side value of the fake EE client. Calls are only evaluated by getInfo(), which counts the round trips.
+    Methods without a local evaluation (clip, select, filterDate, ...) return a value evaluated to their call.
+    """
+
+    def __init__(self, client, compute):
+        self.client = client
+        self.compute = compute
+
+    def getInfo(self):
+        self.client.get_info_calls += 1
+        return evaluate(self)
+
+    def gt(self, other):
+        return FakeValue(self.client, lambda: evaluate(self) > evaluate(other))
+
+    def format(self, pattern):
+        # Dates are milliseconds since the epoch, formatted as YYYY-MM-dd
+        return FakeValue(self.client, lambda: datetime.datetime.fromtimestamp(
+            evaluate(self) / 1000, datetime.timezone.utc).strftime('%Y-%m-%d'))
+
+    def get(self, index):
+        return FakeValue(self.client, lambda: evaluate(self)[evaluate(index)])
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: FakeValue(self.client, lambda: (name, args))
+
+
+class FakeCollection(FakeValue):
+    """
+    Image collection of the fake EE client, the images are the dictionaries of their properties.
+    """
+
+    def __init__(self, client, images):
+        super().__init__(client, lambda: images)
+        self.images = images
+
+    def filterDate(self, start, end):
+        return self
+
+    def filterBounds(self, geometry):
+        return self
+
+    def size(self):
+        return FakeValue(self.client, lambda: len(self.images))
+
+    def aggregate_min(self, name):
+        return FakeValue(self.client, lambda: min((image[name] for image in self.images), default=None))
+
+    def aggregate_max(self, name):
+        return FakeValue(self.client, lambda: max((image[name] for image in self.images), default=None))
+
+    def aggregate_array(self, name):
+        return FakeValue(self.client, lambda: [image[name] for image in self.images])
+
+    def toList(self, count):
+        return FakeValue(self.client, lambda: self.images[:count])
+
+
+class FakeEE:
+    """
+    Local stand-in of the ee module counting the getInfo() round trips.
+    """
+
+    def __init__(self, images=()):
+        self.get_info_calls = 0
+        self.images = list(images)
+        self.Algorithms = types.SimpleNamespace(
+            If=lambda condition, true_case, false_case: FakeValue(
+                self, lambda: evaluate(true_case) if evaluate(condition) else evaluate(false_case)))
+
+    def ImageCollection(self, collection_id):
+        return FakeCollection(self, self.images)
+
+    def Dictionary(self, dictionary):
+        return FakeValue(self, lambda: dictionary)
+
+    def Date(self, date):
+        return FakeValue(self, lambda: date)
+
+    def __getattr__(self, name):
+        # Constructors without a local evaluation, e.g. ee.Image, ee.Geometry
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: FakeValue(self, lambda: (name, args))
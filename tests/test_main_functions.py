@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+rasterio = pytest.importorskip('rasterio')
+pytest.importorskip('fiona')
+
+from rasterio.transform import from_origin
+
+import main_functions
+
+NODATA = 60000
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """
+    Renders thumbnails without cutline and overlay, returning the RGB array instead of the JPEG.
+    """
+    monkeypatch.setattr(main_functions, 'get_cutline_mask',
+                        lambda crs, transform, shape: np.ones(shape, dtype=bool))
+    monkeypatch.setattr(main_functions, 'apply_overlay', lambda rgb, crs, transform: rgb)
+    thumbnails = []
+    monkeypatch.setattr(main_functions, 'write_thumbnail_jpeg',
+                        lambda rgb, thumbnail_name: thumbnails.append(rgb) or thumbnail_name)
+    return thumbnails
+
+
+def write_raster(filename, data):
+    with rasterio.open(filename, 'w', driver='GTiff', width=data.shape[2], height=data.shape[1], count=data.shape[0],
+                       dtype=data.dtype, crs='EPSG:2056', transform=from_origin(2480000, 1300000, 10, 10),
+                       nodata=NODATA) as dst:
+        dst.write(data)
+
+
+def test_render_rgb_thumbnail(tmp_path, rendered):
+    # 1024 x 512 raster of 4 x 4 pixel blocks, the values increase by 4 per thumbnail column from 100 to 1120
+    thumbnail = np.tile(100 + 4 * np.arange(256, dtype=np.uint16), (128, 1))
+    # Band 3 is brighter on its first rows and has nodata on the last rows, far above the valid values
+    thumbnail = np.stack([thumbnail, thumbnail, thumbnail])
+    thumbnail[2, :8] += 1000
+    thumbnail[2, 120:] = NODATA
+    write_raster(str(tmp_path / 'input.tif'), np.kron(thumbnail, np.ones((1, 4, 4), dtype=np.uint16)))
+
+    assert main_functions.render_rgb_thumbnail(
+        str(tmp_path / 'input.tif'), str(tmp_path / 'thumbnail.jpg')) == str(tmp_path / 'thumbnail.jpg')
+
+    rgb, = rendered
+    # 256 pixels wide, aspect ratio of the raster
+    assert rgb.shape == (3, 128, 256)
+    assert rgb.dtype == np.uint8
+
+    # Stretch between the valid minimum (100) and maximum (2120) with gamma 0.5, nodata is not part of it
+    assert list(rgb[:, 8, 255]) == [int(np.sqrt(1020 / 2020) * 255)] * 3
+    assert list(rgb[:, 0, 255]) == [int(np.sqrt(1020 / 2020) * 255)] * 2 + [255]
+    assert list(rgb[:, 8, 64]) == [int(np.sqrt(256 / 2020) * 255)] * 3
+
+    # Pixels without data in one of the bands and black pixels are filled in grey
+    assert (rgb[:, 120:] == 220).all()
+    assert (rgb[:, 8:120, 0] == 220).all()
+
+
+@pytest.mark.parametrize('product, palette', [
+    ('ch.swisstopo.swisseo_vhi_v100', 'ch.swisstopo.swisseo_vhi'),
+    ('ch.swisstopo.swisseo_s2-sr_v100', None),
+])
+def test_get_thumbnail_palette(product, palette):
+    assert main_functions.get_thumbnail_palette(product) is main_functions.THUMBNAIL_PALETTES.get(palette)
+
+
+def test_create_thumbnail_with_palette(tmp_path, rendered):
+    # One row per VHI class: limits of the classes, over 100 and nodata, below the lower limit
+    values = np.array([0, 10, 11, 20, 30, 40, 50, 60, 61, 100, 101, NODATA, -1], dtype=np.int32)
+    write_raster(str(tmp_path / 'vhi_bands-10m.tif'), np.tile(values[:, None], (1, 1, 256)))
+
+    assert main_functions.create_thumbnail(
+        str(tmp_path / 'vhi_bands-10m.tif'), 'ch.swisstopo.swisseo_vhi_v100') == 'thumbnail.jpg'
+
+    rgb, = rendered
+    colors = main_functions.THUMBNAIL_PALETTES['ch.swisstopo.swisseo_vhi']['colors']
+    assert [tuple(rgb[:, row, 0]) for row in range(len(values))] == [
+        colors[0], colors[0], colors[1], colors[1], colors[2], colors[3], colors[4], colors[5], colors[6], colors[6],
+        colors[7], colors[7], (0, 0, 0)]
+
+
+def test_get_cutline_mask_without_disk_cache(tmp_path, monkeypatch, capsys):
+    # The cache directory cannot be created, a file is in the way
+    (tmp_path / 'cache').write_bytes(b'')
+    monkeypatch.setattr(main_functions.config, 'CUTLINE_MASK_CACHE_DIR', str(tmp_path / 'cache' / 'cutline_masks'))
+    monkeypatch.setattr(main_functions.config, 'BUFFER', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), main_functions.config.BUFFER))
+    monkeypatch.setattr(main_functions, 'cutline_masks', main_functions.OrderedDict())
+    crs = rasterio.crs.CRS.from_epsg(2056)
+    transform = from_origin(2600000, 1280000, 10, 10)
+
+    mask = main_functions.get_cutline_mask(crs, transform, (1200, 1200))
+
+    assert 'Cutline mask cache not written' in capsys.readouterr().out
+    # Cut along the border of the cutline, and cached in memory
+    assert 0 < mask.sum() < mask.size
+    assert len(main_functions.cutline_masks) == 1
+    assert (main_functions.get_cutline_mask(crs, transform, (1200, 1200)) == mask).all()
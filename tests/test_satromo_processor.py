@@ -0,0 +1,165 @@
+import time
+
+import pytest
+
+ee = pytest.importorskip('ee')
+pytest.importorskip('pydrive')
+
+import satromo_processor
+from conftest import FakeEE
+
+# 2024-02-23T10:15:59Z and 2024-02-25T10:15:59Z
+IMAGES = [
+    {'system:index': 'S2-L2A_mosaic_2024-02-25T101559_bands-10m', 'system:time_start': 1708856159000},
+    {'system:index': 'S2-L2A_mosaic_2024-02-23T101559_bands-10m', 'system:time_start': 1708683359000},
+]
+
+
+def test_get_collection_info(monkeypatch):
+    fake_ee = FakeEE(IMAGES)
+    monkeypatch.setattr(satromo_processor, 'ee', fake_ee)
+
+    assert satromo_processor.get_collection_info(fake_ee.ImageCollection('collection')) == (
+        '2024-02-23', '2024-02-25', 2,
+        ['S2-L2A_mosaic_2024-02-25T101559_bands-10m', 'S2-L2A_mosaic_2024-02-23T101559_bands-10m'])
+    assert fake_ee.get_info_calls == 1
+
+
+def test_get_collection_info_empty_collection(monkeypatch):
+    fake_ee = FakeEE()
+    monkeypatch.setattr(satromo_processor, 'ee', fake_ee)
+
+    # The dates of an empty collection are not formatted
+    assert satromo_processor.get_collection_info(fake_ee.ImageCollection('collection')) == (None, None, 0, [])
+    assert fake_ee.get_info_calls == 1
+
+
+def test_process_S2_LEVEL_2A_single_round_trip(monkeypatch):
+    fake_ee = FakeEE(IMAGES + [
+        {'system:index': 'S2-L2A_mosaic_2024-02-25T101559_bands-20m', 'system:time_start': 1708856159000}])
+    monkeypatch.setattr(satromo_processor, 'ee', fake_ee)
+    monkeypatch.setattr(satromo_processor, 'current_date', '2024-02-25', raising=False)
+    monkeypatch.setattr(satromo_processor, 'current_date_str', '2024-02-25', raising=False)
+    monkeypatch.setattr(satromo_processor, 'check_product_update', lambda product_name, date_string: True)
+    exports = []
+    monkeypatch.setattr(satromo_processor, 'prepare_export',
+                        lambda roi, productitem, productasset, *args: exports.append((productitem, productasset, roi)))
+
+    satromo_processor.process_S2_LEVEL_2A('roi')
+
+    # The statistics and the image ids are fetched once, whatever the number of images
+    assert fake_ee.get_info_calls == 1
+    assert sorted({productitem for productitem, productasset, roi in exports}) == [
+        '2024-02-23T101559', '2024-02-25T101559']
+    assert 'ch.swisstopo.swisseo_s2-sr_v100_mosaic_2024-02-25T101559_bands-10m' in [
+        productasset for productitem, productasset, roi in exports]
+    # The export region is the geometry of the image clipped to the ROI, computed by GEE
+    assert all(roi.compute()[0] == 'geometry' for productitem, productasset, roi in exports)
+
+
+@pytest.fixture
+def export_queue(monkeypatch, tmp_path, state_db):
+    """
+    An empty export queue, whose products are queued by queue_product().
+    """
+    monkeypatch.setattr(satromo_processor, 'export_queue', [])
+    monkeypatch.setattr(satromo_processor.config, 'EXPORT_RETRY_BACKOFF', 0)
+
+    def queue_product(productname, number_of_tiles):
+        satromo_processor.export_queue.append({
+            'exports': [{'image': None, 'scale': 10, 'description': productname, 'region': None,
+                         'filename_prefix': productname + 'quadrant' + str(tile), 'crs': 'EPSG:2056'}
+                        for tile in range(1, number_of_tiles + 1)],
+            'product_status': {'Product': productname, 'LastSceneDate': '2024-02-25',
+                               'RunDate': '2024-02-26', 'Status': 'RUNNING'},
+            'metadata_file': str(tmp_path / (productname + '_metadata.json')),
+            'metadata': {'SWISSTOPO': {'NUMBEROFTILES': number_of_tiles}},
+        })
+        return tmp_path / (productname + '_metadata.json')
+
+    return queue_product
+
+
+@pytest.mark.parametrize('error', [ee.EEException('Too many tasks'), OSError('Connection reset by peer')])
+def test_start_export_retry_does_not_start_a_second_export(monkeypatch, error):
+    monkeypatch.setattr(satromo_processor.config, 'EXPORT_RETRY_BACKOFF', 0)
+    monkeypatch.setattr(ee.batch.Export.image, 'toDrive', lambda **kwargs: ee.batch.Task(
+        None, ee.batch.Task.Type.EXPORT_IMAGE, ee.batch.Task.State.UNSUBMITTED, {'description': 'export'}))
+    monkeypatch.setattr(ee.data, 'getWorkloadTag', lambda: '')
+    monkeypatch.setattr(ee.data, 'newTaskId', lambda count=1: ['REQUESTID'])
+    requests = []
+
+    def export_image(request_id, params):
+        requests.append(request_id)
+        if len(requests) == 1:
+            raise error
+        return {'name': 'projects/earthengine-legacy/operations/' + request_id}
+
+    monkeypatch.setattr(ee.data, 'exportImage', export_image)
+
+    assert satromo_processor.start_export(None, 10, 'export', None, 'exportquadrant1', 'EPSG:2056') == (
+        'REQUESTID', 'exportquadrant1')
+    # The retry sends the same request id, GEE starts the export only once
+    assert requests == ['REQUESTID', 'REQUESTID']
+
+
+def test_submit_exports_cancels_partially_started_products(monkeypatch, export_queue, state_db):
+    failed_metadata_file = export_queue('failed_product', 4)
+    started_metadata_file = export_queue('started_product', 2)
+
+    def start_export(image, scale, description, region, filename_prefix, crs):
+        if filename_prefix == 'failed_productquadrant3':
+            raise ee.EEException('Export failed')
+        return 'TASK_' + filename_prefix, filename_prefix
+
+    monkeypatch.setattr(satromo_processor, 'start_export', start_export)
+    cancelled = []
+    monkeypatch.setattr(ee.data, 'cancelTask', cancelled.append)
+
+    assert satromo_processor.submit_exports() == 2
+
+    # The started tiles of the failed product are cancelled and nothing is recorded for it
+    assert sorted(cancelled) == ['TASK_failed_productquadrant1', 'TASK_failed_productquadrant2',
+                                 'TASK_failed_productquadrant4']
+    assert state_db.get_product_update('failed_product') is None
+    assert not failed_metadata_file.exists()
+    # The other product is recorded
+    assert sorted(state_db.get_running_tasks()) == [
+        ('TASK_started_productquadrant1', 'started_productquadrant1'),
+        ('TASK_started_productquadrant2', 'started_productquadrant2')]
+    assert state_db.get_product_update('started_product')['Status'] == 'RUNNING'
+    assert started_metadata_file.exists()
+
+
+def test_submit_exports_records_all_tasks_at_once(monkeypatch, export_queue, state_db):
+    export_queue('first_product', 4)
+    export_queue('second_product', 2)
+    monkeypatch.setattr(satromo_processor, 'start_export',
+                        lambda image, scale, description, region, filename_prefix, crs: ('TASK_' + filename_prefix, filename_prefix))
+    add_running_tasks = []
+    monkeypatch.setattr(state_db, 'add_running_tasks', add_running_tasks.append)
+
+    assert satromo_processor.submit_exports() == 6
+
+    assert len(add_running_tasks) == 1
+    assert len(add_running_tasks[0]) == 6
+    assert satromo_processor.export_queue == []
+
+
+def test_submit_exports_throughput(monkeypatch, export_queue, state_db):
+    # 16 exports whose start takes 50 ms each, like the requests to GEE
+    export_queue('product', 16)
+    monkeypatch.setattr(satromo_processor.config, 'EXPORT_MAX_WORKERS', 8)
+
+    def start_export(image, scale, description, region, filename_prefix, crs):
+        time.sleep(0.05)
+        return 'TASK_' + filename_prefix, filename_prefix
+
+    monkeypatch.setattr(satromo_processor, 'start_export', start_export)
+
+    start = time.perf_counter()
+    assert satromo_processor.submit_exports() == 16
+    elapsed = time.perf_counter() - start
+
+    # Started one after another, the exports take 0.8 s
+    assert elapsed < 0.4
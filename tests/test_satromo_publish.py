@@ -0,0 +1,160 @@
+import json
+import os
+
+import pytest
+
+ee = pytest.importorskip('ee')
+pytest.importorskip('pydrive')
+pytest.importorskip('rasterio')
+
+import configuration as config
+import satromo_publish
+import satromo_publish_stac_fsdi
+
+PRODUCT = 'ch.swisstopo.swisseo_s2-sr_v100'
+FILENAME = PRODUCT + '_mosaic_2024-02-25T101559_bands-10m'
+
+
+@pytest.fixture
+def task_queue(monkeypatch, list_operations):
+    """
+    Replaces the GEE task queue by the recorded operations.
+    """
+    monkeypatch.setattr(ee.data, 'listOperations', lambda *args, **kwargs: list(list_operations))
+    monkeypatch.setattr(satromo_publish, 'task_statuses', {})
+
+
+@pytest.fixture
+def processing_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'PROCESSING_DIR', str(tmp_path))
+    return tmp_path
+
+
+class DriveFile(dict):
+    """
+    File on Google Drive, recording its deletion.
+    """
+    deleted = False
+
+    def Delete(self):
+        self.deleted = True
+
+
+@pytest.fixture
+def publication(tmp_path, monkeypatch, state_db):
+    """
+    A RUNNING product whose tiles are completed on Google Drive and merged locally.
+    """
+    state_db.set_product_update({'Product': PRODUCT, 'LastSceneDate': '2024-02-25',
+                                 'RunDate': '2024-02-26', 'Status': 'RUNNING'})
+    state_db.add_running_tasks([('TASK' + str(tile), FILENAME + 'quadrant' + str(tile)) for tile in range(1, 3)])
+    drive_files = [DriveFile(title=FILENAME + 'quadrant' + str(tile) + '.tif') for tile in range(1, 3)]
+    monkeypatch.setattr(satromo_publish, 'drive_inventory', {FILENAME: list(drive_files)})
+
+    file_merged = tmp_path / (FILENAME + '.tif')
+    file_merged.write_bytes(b'COG')
+    metadata = {'SWISSTOPO': {'ITEM': '2024-02-25T101559', 'PRODUCT': PRODUCT, 'GEOCATID': 'geocat'}}
+    monkeypatch.setattr(satromo_publish, 'prepare_publication',
+                        lambda filename: (str(file_merged), metadata, False))
+
+    moved_files = []
+    monkeypatch.setattr(satromo_publish, 'move_files_with_rclone',
+                        lambda source, destination, move=True: moved_files.append(source))
+    monkeypatch.setattr(satromo_publish, 'S3_DESTINATION', 's3:bucket', raising=False)
+
+    # FSDI STAC with an existing item
+    monkeypatch.setattr(satromo_publish_stac_fsdi, 'initialize_session', lambda: None)
+    monkeypatch.setattr(satromo_publish_stac_fsdi, 'is_existing', lambda item_path: True)
+    monkeypatch.setattr(satromo_publish_stac_fsdi, 'create_asset', lambda asset_url, payload: True)
+
+    return {'file_merged': file_merged, 'drive_files': drive_files, 'moved_files': moved_files}
+
+
+def test_failed_stac_upload_keeps_the_product_running(publication, monkeypatch, state_db):
+    monkeypatch.setattr(satromo_publish_stac_fsdi, 'upload_asset_multipart',
+                        lambda filename, asset_url: False)
+
+    satromo_publish.run_publication_pipeline([FILENAME])
+
+    # Nothing is moved to S3 and the tiles stay on Google Drive, the next run resumes the upload
+    assert publication['moved_files'] == []
+    assert not any(drive_file.deleted for drive_file in publication['drive_files'])
+    assert state_db.get_product_update(PRODUCT)['Status'] == 'RUNNING'
+    assert sorted(filename for task_id, filename in state_db.get_running_tasks()) == [
+        FILENAME + 'quadrant1', FILENAME + 'quadrant2']
+    # Only the local merged file is removed
+    assert not publication['file_merged'].exists()
+
+
+def test_fetch_task_statuses(task_queue):
+    task_statuses = satromo_publish.fetch_task_statuses(
+        ['3QE2LAXM6PZ4SVEJEHQTJ7IL', '6YQOZSKLBNCYK7JJ2SJXHJQ3', 'UNKNOWNTASKID'])
+
+    # Operations are indexed by the basename of their name and converted to task statuses
+    assert task_statuses['3QE2LAXM6PZ4SVEJEHQTJ7IL']['state'] == 'COMPLETED'
+    assert task_statuses['3QE2LAXM6PZ4SVEJEHQTJ7IL']['description'] == 'COL_S2_SR_HARMONIZED_SWISS_2024-02-24_10m'
+    assert task_statuses['6YQOZSKLBNCYK7JJ2SJXHJQ3']['state'] == 'RUNNING'
+    # Tasks missing from the task queue are unknown
+    assert task_statuses['UNKNOWNTASKID'] == {'id': 'UNKNOWNTASKID', 'state': 'UNKNOWN'}
+    assert satromo_publish.get_task_status('UNKNOWNTASKID')['state'] == 'UNKNOWN'
+
+
+@pytest.mark.parametrize('task_ids, number_of_tiles, ready', [
+    # All tiles registered and completed
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', 'VGZ7QK3WUS6X4FHYZJ2ELMNR'], 2, True),
+    # A tile is not registered yet
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', 'VGZ7QK3WUS6X4FHYZJ2ELMNR'], 3, False),
+    # No metadata, the number of tiles is unknown
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', 'VGZ7QK3WUS6X4FHYZJ2ELMNR'], None, False),
+    # A tile is running, failed or missing from the task queue
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', '6YQOZSKLBNCYK7JJ2SJXHJQ3'], 2, False),
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', 'N3HAB6YLCKMM2X7TUEVQ4WDO'], 2, False),
+    (['3QE2LAXM6PZ4SVEJEHQTJ7IL', 'UNKNOWNTASKID'], 2, False),
+])
+def test_get_ready_filenames(task_queue, processing_dir, state_db, task_ids, number_of_tiles, ready):
+    state_db.add_running_tasks([(task_id, FILENAME + 'quadrant' + str(tile))
+                                for tile, task_id in enumerate(task_ids, start=1)])
+    if number_of_tiles is not None:
+        with open(processing_dir / (FILENAME + '_metadata.json'), 'w') as f:
+            json.dump({'SWISSTOPO': {'NUMBEROFTILES': number_of_tiles}}, f)
+
+    assert satromo_publish.get_ready_filenames() == ([FILENAME] if ready else [])
+
+
+def test_merge_files_matches_single_pass_merge(tmp_path, monkeypatch):
+    np = pytest.importorskip('numpy')
+    from rasterio.features import geometry_mask
+    from rasterio.merge import merge
+    from rasterio.transform import from_origin
+
+    # 2 x 2 tiles of 600 x 600 pixels on the border of the cutline, merged in windows of 256 pixels
+    tile_dir = tmp_path / 'gdrive'
+    tile_dir.mkdir()
+    rng = np.random.default_rng(0)
+    for tile, (x, y) in enumerate([(0, 0), (1, 0), (0, 1), (1, 1)]):
+        with satromo_publish.rasterio.open(
+                str(tile_dir / ('mosaicquadrant' + str(tile) + '.tif')), 'w', driver='GTiff', width=600, height=600,
+                count=3, dtype='uint16', crs='EPSG:2056', nodata=config.NODATA,
+                transform=from_origin(2600000 + x * 6000, 1280000 - y * 6000, 10, 10)) as dst:
+            dst.write(rng.integers(0, 4000, (3, 600, 600), dtype=np.uint16))
+    monkeypatch.setattr(satromo_publish, 'GDRIVE_MOUNT', str(tile_dir), raising=False)
+    monkeypatch.setattr(satromo_publish, 'os_name', 'Linux', raising=False)
+    monkeypatch.setattr(config, 'MERGE_WINDOW_SIZE', 256)
+    monkeypatch.setattr(config, 'CUTLINE_MASK_CACHE_DIR', str(tmp_path / 'cutline_masks'))
+    monkeypatch.setattr(config, 'BUFFER', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                      config.BUFFER))
+    monkeypatch.chdir(tmp_path)
+
+    assert satromo_publish.merge_files('mosaic') == 'mosaic.tif'
+
+    # Same pixels as the whole mosaic merged at once and cut along the cutline, like gdalbuildvrt and gdalwarp
+    data, transform = merge(sorted(str(tile) for tile in tile_dir.iterdir()), nodata=config.NODATA)
+    merged_crs = satromo_publish.rasterio.crs.CRS.from_epsg(2056)
+    cutline_mask = geometry_mask(satromo_publish.main_functions.get_shapes(config.BUFFER, merged_crs),
+                                 out_shape=data.shape[1:], transform=transform, invert=True)
+    data[:, ~cutline_mask] = config.NODATA
+    with satromo_publish.rasterio.open('mosaic.tif') as merged:
+        assert merged.transform == transform
+        assert (merged.read() == data).all()
+        # Both sides of the cutline are part of the mosaic
+        assert 0 < cutline_mask.sum() < cutline_mask.size
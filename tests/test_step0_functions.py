@@ -0,0 +1,191 @@
+import datetime
+
+import pytest
+
+ee = pytest.importorskip('ee')
+pytest.importorskip('rasterio')
+
+import configuration as config
+import step0_functions
+
+COLLECTION = 'projects/satromo-int/assets/COL_S2_SR_HARMONIZED_SWISS'
+
+
+def operation(description, state, task_id=None):
+    """
+    Returns an export operation as listed by ee.data.listOperations.
+    """
+    return {
+        'name': 'projects/earthengine-legacy/operations/' + (task_id or description.upper().replace('-', '_')),
+        'metadata': {
+            '@type': 'type.googleapis.com/google.earthengine.v1alpha.OperationMetadata',
+            'state': state,
+            'description': description,
+            'type': 'EXPORT_IMAGE',
+        },
+        'done': state in ['SUCCEEDED', 'FAILED', 'CANCELLED'],
+    }
+
+
+@pytest.fixture
+def task_queue(monkeypatch, state_db):
+    """
+    Replaces the GEE task queue by a list of operations and resets the step0 state of the run.
+    """
+    operations = []
+    monkeypatch.setattr(ee.data, 'listOperations', lambda *args, **kwargs: list(operations))
+    monkeypatch.setattr(step0_functions, 'operations_index', None)
+    monkeypatch.setattr(step0_functions, 'new_completed_tasks', {})
+    monkeypatch.setattr(step0_functions, 'launched_dates', 0)
+    monkeypatch.setattr(config, 'step0', {
+        COLLECTION: {'step0_function': 'generate_asset', 'asset_resolutions': ['10m', '20m']},
+        'projects/satromo-int/assets/COL_S2_TOA_SWISS': {'step0_function': 'generate_asset',
+                                                         'asset_resolutions': ['10m']},
+    })
+    return operations
+
+
+@pytest.fixture
+def recorded_operations(task_queue, list_operations):
+    """
+    Fills the task queue with the recorded operations.
+    """
+    task_queue.extend(list_operations)
+    return task_queue
+
+
+@pytest.fixture
+def started_dates(monkeypatch):
+    """
+    Records the dates whose asset generation is started, in order.
+    """
+    started = []
+    monkeypatch.setattr(step0_functions, 'generate_asset',
+                        lambda date, collection, description: started.append((collection, date, description)),
+                        raising=False)
+    monkeypatch.setattr(config, 'STEP0_MAX_WORKERS', 1)
+    return started
+
+
+def test_count_running_dates_only_counts_step0_collections(task_queue):
+    task_queue.extend([
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-25_10m', 'RUNNING'),
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-25_20m', 'PENDING'),
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-24_10m', 'PENDING'),
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-23_10m', 'SUCCEEDED'),
+        operation('COL_S2_TOA_SWISS_2024-02-25', 'RUNNING'),
+        # Product export of the processor and export of another project
+        operation('ch.swisstopo.swisseo_s2-sr_v100_mosaic_2024-02-25T235959_bands-10m', 'RUNNING'),
+        operation('OTHER_COLLECTION_2024-02-25_10m', 'RUNNING'),
+    ])
+
+    assert step0_functions.count_running_dates(step0_functions.get_operations_index()) == 3
+
+
+def test_backfill_collection_starts_newest_dates_first(task_queue, started_dates, monkeypatch):
+    monkeypatch.setattr(config, 'STEP0_MAX_RUNNING_DATES', 10)
+
+    step0_functions.backfill_collection(COLLECTION, ['2024-02-20', '2024-02-23', '2024-02-21', '2024-02-22'])
+
+    assert started_dates == [
+        (COLLECTION, '2024-02-23', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-23'),
+        (COLLECTION, '2024-02-22', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-22'),
+        (COLLECTION, '2024-02-21', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-21'),
+        (COLLECTION, '2024-02-20', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-20'),
+    ]
+
+
+def test_backfill_collection_keeps_running_dates_under_ceiling(task_queue, started_dates, monkeypatch):
+    monkeypatch.setattr(config, 'STEP0_MAX_RUNNING_DATES', 3)
+    task_queue.extend([
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-25_10m', 'RUNNING'),
+        operation('COL_S2_SR_HARMONIZED_SWISS_2024-02-25_20m', 'RUNNING'),
+        # Not counted against the ceiling
+        operation('ch.swisstopo.swisseo_s2-sr_v100_mosaic_2024-02-25T235959_bands-10m', 'RUNNING'),
+        operation('OTHER_COLLECTION_2024-02-25_10m', 'RUNNING'),
+    ])
+
+    step0_functions.backfill_collection(COLLECTION, ['2024-02-20', '2024-02-23', '2024-02-21', '2024-02-22'])
+
+    # One date is running, two slots are left for the newest missing dates
+    assert [date for collection, date, description in started_dates] == ['2024-02-23', '2024-02-22']
+
+    # The ceiling is shared by the collections of the run
+    step0_functions.backfill_collection('projects/satromo-int/assets/COL_S2_TOA_SWISS', ['2024-02-24'])
+
+    assert len(started_dates) == 2
+
+
+def test_step0_check_collection_requires_all_resolutions(task_queue, started_dates, monkeypatch):
+    monkeypatch.setattr(step0_functions, 'asset_catalogs', {})
+    monkeypatch.setattr(ee.data, 'listAssets', lambda params: {'assets': [
+        {'id': COLLECTION + '/S2-L2A_mosaic_2024-02-24_bands-10m', 'properties': {'date': '2024-02-24'}},
+        {'id': COLLECTION + '/S2-L2A_mosaic_2024-02-24_bands-20m', 'properties': {'date': '2024-02-24'}},
+        {'id': COLLECTION + '/S2-L2A_mosaic_2024-02-25_bands-10m', 'properties': {'date': '2024-02-25'}},
+    ]})
+
+    assert not step0_functions.step0_check_collection(COLLECTION, 1, '2024-02-25')
+
+    # The date without its 20m asset is generated again
+    assert [date for collection, date, description in started_dates] == ['2024-02-25']
+
+
+def test_get_operations_index_groups_exports_by_date_prefix(recorded_operations):
+    operations_index = step0_functions.get_operations_index()
+
+    assert sorted(operations_index) == [
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-22',
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-23',
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-24',
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-25',
+        'ch.swisstopo.swisseo_s2-sr_v100_mosaic_2024-02-25',
+    ]
+    # Both resolutions of a date are grouped, ingestions and exports without date are left out
+    assert [task['metadata']['description'] for task in operations_index['COL_S2_SR_HARMONIZED_SWISS_2024-02-25']] == [
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-25_10m',
+        'COL_S2_SR_HARMONIZED_SWISS_2024-02-25_20m',
+    ]
+
+
+@pytest.mark.parametrize('check_date, assets_by_date, asset_state', [
+    # Running and pending tasks, the asset is not generated again
+    (datetime.date(2024, 2, 25), {}, 'RUNNING'),
+    # Completed task with its asset in all resolutions
+    (datetime.date(2024, 2, 24), {'2024-02-24': {'10m': {}, '20m': {}}}, 'READY'),
+    # Completed task with an asset missing in one resolution, the asset is generated again
+    (datetime.date(2024, 2, 24), {'2024-02-24': {'10m': {}}}, 'MISSING'),
+    # Completed task whose asset was deleted, the asset is generated again
+    (datetime.date(2024, 2, 23), {}, 'MISSING'),
+    # Failed task, the asset is generated again
+    (datetime.date(2024, 2, 22), {}, 'MISSING'),
+    # No task
+    (datetime.date(2024, 2, 21), {}, 'MISSING'),
+])
+def test_get_asset_state(recorded_operations, check_date, assets_by_date, asset_state):
+    assert step0_functions.get_asset_state(
+        COLLECTION, assets_by_date, check_date, step0_functions.get_operations_index()) == asset_state
+
+
+def test_get_asset_state_empty_asset(recorded_operations, state_db):
+    state_db.add_empty_asset('COL_S2_SR_HARMONIZED_SWISS', '2024-02-22', 'no scene')
+
+    assert step0_functions.get_asset_state(
+        COLLECTION, {}, datetime.date(2024, 2, 22), step0_functions.get_operations_index()) == 'READY'
+
+
+def test_completed_tasks_are_stored_once(recorded_operations, state_db):
+    operations_index = step0_functions.get_operations_index()
+    for day in [22, 23, 24, 25]:
+        step0_functions.get_asset_state(COLLECTION, {}, datetime.date(2024, 2, day), operations_index)
+    step0_functions.write_completed_tasks()
+
+    # Only the succeeded tasks are stored, converted to task statuses
+    rows = state_db.execute('SELECT id, description, state FROM completed_tasks ORDER BY description')
+    assert [tuple(row) for row in rows] == [
+        ('VGZ7QK3WUS6X4FHYZJ2ELMNR', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-23_10m', 'COMPLETED'),
+        ('3QE2LAXM6PZ4SVEJEHQTJ7IL', 'COL_S2_SR_HARMONIZED_SWISS_2024-02-24_10m', 'COMPLETED'),
+    ]
+
+    # Stored tasks are not registered again
+    step0_functions.get_asset_state(COLLECTION, {}, datetime.date(2024, 2, 24), operations_index)
+    assert step0_functions.new_completed_tasks == {}